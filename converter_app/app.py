@@ -4,18 +4,19 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from flask import Flask, Response, abort, jsonify, make_response, request
+from flask import Flask, Response, abort, jsonify, make_response, request, stream_with_context
 from flask_cors import CORS
 from flask_httpauth import HTTPBasicAuth
 
-from .converters import Converter
+from . import __version__
+from .converters import Converter, match_pool
 from .datasets import Dataset
-from .models import File, Profile
-from .options import OPTIONS
+from .models import File, Profile, conversion_cache, table_store
+from .options import OPTIONS, XYDATA_ENCODINGS
 from .readers import registry
 from .utils import checkpw, human2bytes
 from .writers.jcamp import JcampWriter
-from .writers.jcampzip import JcampZipWriter
+from .writers.jcampzip import JcampZipWriter, render_pool
 
 
 def create_app(test_config=None):
@@ -40,12 +41,29 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY=os.getenv('SECRET_KEY'),
         PROFILES_DIR=os.getenv('PROFILES_DIR', 'profiles'),
+        PROFILES_CACHE_SIZE=int(os.getenv('PROFILES_CACHE_SIZE', '32')),
+        MATCH_WORKERS=int(os.getenv('MATCH_WORKERS', '0')),
         DATASETS_DIR=os.getenv('DATASETS_DIR', 'datasets'),
         MAX_CONTENT_LENGTH=human2bytes(os.getenv('MAX_CONTENT_LENGTH', '64M')),
+        MAGIC_BUFFER_SIZE=human2bytes(os.getenv('MAGIC_BUFFER_SIZE', '64K')),
+        SPOOL_SIZE=human2bytes(os.getenv('SPOOL_SIZE', '8M')),
+        ZIP_COMPRESSLEVEL=int(os.getenv('ZIP_COMPRESSLEVEL', '6')),
+        CONVERSIONS_CACHE_DIR=os.getenv('CONVERSIONS_CACHE_DIR'),
+        CONVERSIONS_CACHE_SIZE=human2bytes(os.getenv('CONVERSIONS_CACHE_SIZE', '1G')),
+        TABLES_STORE_DIR=os.getenv('TABLES_STORE_DIR'),
+        TABLES_STORE_TTL=int(os.getenv('TABLES_STORE_TTL', '3600')),
+        TABLES_STORE_SIZE=human2bytes(os.getenv('TABLES_STORE_SIZE', '1G')),
+        RENDER_WORKERS=int(os.getenv('RENDER_WORKERS', '0')),
         CORS=bool(os.getenv('CORS', False)),
         CLIENTS=clients
     )
 
+    # start the pools of processes for the matching and the rendering, now instead of during a request
+    if app.config['MATCH_WORKERS'] > 1:
+        match_pool.start(app.config['MATCH_WORKERS'])
+    if app.config['RENDER_WORKERS'] > 1:
+        render_pool.start(app.config['RENDER_WORKERS'])
+
     # configure CORS
     if app.config['CORS']:
         CORS(app, expose_headers=['Content-Disposition'])
@@ -93,23 +111,76 @@ def create_app(test_config=None):
         return jcamp based on profile
         '''
         client_id = auth.current_user()
-        if request.files.get('file'):
-            file = File(request.files.get('file'))
-            reader = registry.match_reader(file)
+        if request.files.get('file') or request.form.get('handle'):
+            upload = request.files.get('file')
 
-            if reader:
-                reader.process()
-                converter = Converter.match_profile(client_id, reader.as_dict)
+            # instead of a file, the handle of the tables returned by /tables can be used
+            stored = None
+            if upload:
+                file_name = upload.filename
+            else:
+                if app.config['TABLES_STORE_DIR']:
+                    stored = table_store.load(client_id, request.form.get('handle'))
+
+                if stored is None:
+                    return jsonify({'error': 'The tables for this handle are not available (anymore).'}), 404
+
+                file_name = stored['upload'][1]
+
+            # the output for the same upload, profiles, format, and version is taken from the cache
+            cache_key = None
+            if app.config['CONVERSIONS_CACHE_DIR']:
+                if upload:
+                    upload_key = [conversion_cache.get_upload_hash(upload), upload.filename, upload.content_type]
+                else:
+                    upload_key = stored['upload']
+
+                cache_key = conversion_cache.get_key(
+                    *upload_key,
+                    client_id, Profile.list(client_id).version, request.form.get('format', 'jcampzip'), __version__
+                )
+                fp = conversion_cache.open(cache_key)
+                if fp is not None:
+                    if request.form.get('format', 'jcampzip').partition(':')[0] == 'jcampzip':
+                        writer_class = JcampZipWriter
+                    else:
+                        writer_class = JcampWriter
+
+                    file_name = Path(file_name).with_suffix(writer_class.suffix)
+
+                    response = Response(conversion_cache.read(fp), mimetype=writer_class.mimetype)
+                    response.headers['Content-Disposition'] = 'attachment;filename={}'.format(file_name)
+                    return response
+
+            if stored is None:
+                file = File(upload)
+                reader = registry.match_reader(file)
+
+                if reader:
+                    reader.process()
+                    data = reader.as_dict
+                else:
+                    data = None
+            else:
+                data = stored['data']
+
+            if data:
+                converter = Converter.match_profile(client_id, data)
 
                 if converter:
                     converter.process()
 
-                    conversion_format = request.form.get('format', 'jcampzip')
+                    # the format can select the encoding of the xydata, e.g. jcamp:difdup
+                    conversion_format, _, encoding = request.form.get('format', 'jcampzip').partition(':')
+                    encoding = encoding.upper() or None
+                    if encoding is not None and encoding not in XYDATA_ENCODINGS:
+                        return jsonify({'error': 'Conversion format is not supported.'}), 400
+
                     if conversion_format == 'jcampzip':
-                        writer = JcampZipWriter(converter)
+                        writer = JcampZipWriter(converter, encoding)
                     elif conversion_format == 'jcamp':
                         if len(converter.tables) == 1:
-                            writer = JcampWriter(converter)
+                            writer = JcampWriter(converter, encoding)
                         else:
                             return jsonify({'error': 'Conversion to a single JCAMP file is not supported for this file.'}), 400
                     else:
@@ -120,9 +191,14 @@ def create_app(test_config=None):
                     except AssertionError:
                         return jsonify({'error': 'There was an error while converting your file.'}), 400
 
-                    file_name = Path(file.name).with_suffix(writer.suffix)
+                    file_name = Path(file_name).with_suffix(writer.suffix)
 
-                    response = Response(writer.write(), mimetype=writer.mimetype)
+                    # the output is streamed while it is written (and stored in the cache)
+                    chunks = writer.stream()
+                    if cache_key is not None:
+                        chunks = conversion_cache.store(cache_key, chunks)
+
+                    response = Response(stream_with_context(chunks), mimetype=writer.mimetype)
                     response.headers['Content-Disposition'] = 'attachment;filename={}'.format(file_name)
                     return response
 
@@ -137,18 +213,30 @@ def create_app(test_config=None):
         Step 1 (advanced): upload file and convert to table
         '''
         if request.files.get('file'):
-            file = File(request.files.get('file'))
+            upload = request.files.get('file')
+            file = File(upload)
             reader = registry.match_reader(file)
 
             if reader:
                 reader.process()
                 reader.validate()
 
+                # if a handle is requested (e.g. handle=true), the complete tables
+                # are kept, so that /conversions can use them with the handle
+                handle = None
+                if app.config['TABLES_STORE_DIR'] and request.form.get('handle'):
+                    handle = table_store.store(auth.current_user(), {
+                        'upload': [conversion_cache.get_upload_hash(upload), upload.filename, upload.content_type],
+                        'data': reader.as_dict
+                    })
+
                 # only return the first 10 rows of each table
-                for index, table in enumerate(reader.tables):
-                    reader.tables[index]['rows'] = table['rows'][:10]
+                data = reader.as_dict
+                data['tables'] = [dict(table, rows=table['rows'][:10]) for table in reader.tables]
+                if handle is not None:
+                    data['handle'] = handle
 
-                return jsonify(reader.as_dict), 201
+                return jsonify(data), 201
             else:
                 return jsonify(
                     {'error': 'Your file could not be processed.'}), 400
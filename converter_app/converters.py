@@ -1,104 +1,177 @@
+import bisect
 import copy
+import hashlib
+import itertools
+import json
 import logging
+import math
+import operator
 import os
 import re
+import threading
+import weakref
+from collections import OrderedDict, defaultdict
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
 
-from .models import Profile
+from flask import current_app
+
+from .models import FloatColumn, NumberColumn, Profile, TableRows, profile_cache
+from .utils import ProcessPool
 
 logger = logging.getLogger(__name__)
 
 
 class Converter(object):
 
-    def __init__(self, profile, file_data):
+    # the minimal number of profiles for the parallel matching (see MATCH_WORKERS)
+    parallel_min_profiles = 100
+
+    # the operators of the x and y operations
+    operators = {
+        '+': operator.add,
+        '-': operator.sub,
+        '*': operator.mul,
+        ':': operator.truediv
+    }
+
+    def __init__(self, profile, file_data, header_indexes=None):
         self.profile = profile
-        self.matches = []
+        self.compiled_profile = CompiledProfile.get(profile)
+        self.results = []
         self.tables = []
         self.file_metadata = file_data.get('metadata', {})
         self.input_tables = file_data.get('tables', [])
 
+        # the header indexes of the input tables can be shared by the converters of all profiles
+        self.header_indexes = {} if header_indexes is None else header_indexes
+
+        # only the matchers are created here, the identifiers, the matches and the output tables
+        # are created when they are used, which is only the case for the profile which matched
+        self._identifiers = None
+        self._matches = None
+        self._output_tables = None
+
         if self.profile.data.get('matchTables'):
-            profile_identifiers = self.profile.data.get('identifiers', [])
-            profile_output_tables = self.profile.data.get('tables', [])
-
-            self.identifiers = []
-            for identifier in profile_identifiers:
-                if identifier.get('outputTableIndex') is None:
-                    # if no outputTableIndex was set this identifier is valid for every table
-                    # no adjustment has to be done
-                    self.identifiers.append(identifier)
+            self.matchers = []
+            for matcher in self.compiled_profile.matchers:
+                if matcher.identifier.get('outputTableIndex') is None:
+                    self.matchers.append(matcher)
                 else:
-                    # adjust this identifier for every input table
                     for input_table_index, input_table in enumerate(self.input_tables):
-                        # make a copy of the identifier and adjust the outputTableIndex
-                        identifier_copy = copy.deepcopy(identifier)
-                        identifier_copy['outputTableIndex'] = input_table_index
-
-                        # adjust the (input)tableIndex as well if it was not null
-                        if identifier_copy.get('tableIndex') is not None:
-                            identifier_copy['tableIndex'] = input_table_index
-
-                        self.identifiers.append(identifier_copy)
-
-            # match the output Table to the input tables and adjust the tableIndexes to the input table
-            self.output_tables = []
-            for input_table_index, input_table in enumerate(self.input_tables):
-                output_table = copy.deepcopy(profile_output_tables[0])
-                output_table_table = output_table.get('table')
-                if output_table_table:
-                    if 'xColumn' in output_table_table:
-                        output_table_table['xColumn']['tableIndex'] = input_table_index
-                    if 'xColumn' in output_table_table:
-                        output_table_table['yColumn']['tableIndex'] = input_table_index
-                    for xOperation in output_table_table.get('xOperations', []):
-                        if 'column' in xOperation:
-                            xOperation['column']['tableIndex'] = input_table_index
-                    for yOperation in output_table_table.get('yOperations', []):
-                        if 'column' in yOperation:
-                            yOperation['column']['tableIndex'] = input_table_index
-
-                self.output_tables.append(output_table)
-
+                        self.matchers.append(matcher.for_table(input_table_index))
         else:
-            self.output_tables = self.profile.data.get('tables', [])
-            self.identifiers = self.profile.data.get('identifiers', [])
+            self.matchers = self.compiled_profile.matchers
+
+    @property
+    def identifiers(self):
+        if self._identifiers is None:
+            if self.profile.data.get('matchTables'):
+                profile_identifiers = self.profile.data.get('identifiers', [])
+
+                self._identifiers = []
+                for identifier in profile_identifiers:
+                    if identifier.get('outputTableIndex') is None:
+                        # if no outputTableIndex was set this identifier is valid for every table
+                        # no adjustment has to be done
+                        self._identifiers.append(identifier)
+                    else:
+                        # adjust this identifier for every input table
+                        for input_table_index, input_table in enumerate(self.input_tables):
+                            # make a copy of the identifier and adjust the outputTableIndex
+                            identifier_copy = copy.deepcopy(identifier)
+                            identifier_copy['outputTableIndex'] = input_table_index
+
+                            # adjust the (input)tableIndex as well if it was not null
+                            if identifier_copy.get('tableIndex') is not None:
+                                identifier_copy['tableIndex'] = input_table_index
+
+                            self._identifiers.append(identifier_copy)
+            else:
+                self._identifiers = self.profile.data.get('identifiers', [])
+
+        return self._identifiers
+
+    @property
+    def output_tables(self):
+        if self._output_tables is None:
+            if self.profile.data.get('matchTables'):
+                profile_output_tables = self.profile.data.get('tables', [])
+
+                # match the output Table to the input tables and adjust the tableIndexes to the input table
+                self._output_tables = []
+                for input_table_index, input_table in enumerate(self.input_tables):
+                    output_table = copy.deepcopy(profile_output_tables[0])
+                    output_table_table = output_table.get('table')
+                    if output_table_table:
+                        if 'xColumn' in output_table_table:
+                            output_table_table['xColumn']['tableIndex'] = input_table_index
+                        if 'xColumn' in output_table_table:
+                            output_table_table['yColumn']['tableIndex'] = input_table_index
+                        for xOperation in output_table_table.get('xOperations', []):
+                            if 'column' in xOperation:
+                                xOperation['column']['tableIndex'] = input_table_index
+                        for yOperation in output_table_table.get('yOperations', []):
+                            if 'column' in yOperation:
+                                yOperation['column']['tableIndex'] = input_table_index
+
+                    self._output_tables.append(output_table)
+            else:
+                self._output_tables = self.profile.data.get('tables', [])
+
+        return self._output_tables
+
+    @property
+    def matches(self):
+        if self._matches is None:
+            self._matches = [{
+                'identifier': identifier,
+                'result': result
+            } for identifier, result in zip(self.identifiers, self.results)]
+
+        return self._matches
 
     def match(self):
-        for identifier in self.identifiers:
-            match = self.match_identifier(identifier)
-            if match is False and not identifier.get('optional'):
-                # return immediately if one (non optional) identifier does not match
-                return False
+        # check the non optional identifiers first, the cheapest first, and
+        # return immediately if one (non optional) identifier does not match
+        results = {}
+        for index in sorted(range(len(self.matchers)), key=lambda index: self.matchers[index].cost):
+            matcher = self.matchers[index]
+            if not matcher.optional:
+                match = self.match_identifier(matcher)
+                if match is False:
+                    return False
+
+                results[index] = match
+
+        # match the optional identifiers and store all results in the order of the identifiers
+        for index, matcher in enumerate(self.matchers):
+            match = results[index] if index in results else self.match_identifier(matcher)
 
             if match and 'value' in match:
-                match_operations = identifier.get('operations', [])
-                for match_operation in match_operations:
+                for match_operation in matcher.operations:
                     match['value'] = self.run_identifier_operation(match['value'], match_operation)
 
-            # store match
-            self.matches.append({
-                'identifier': identifier,
-                'result': match
-            })
+            self.results.append(match)
 
         # if everything matched, return how many identifiers matched
-        return len(self.matches)
-
-    def match_identifier(self, identifier):
-        if identifier.get('type') == 'fileMetadata':
-            return self.match_file_metadata(identifier, self.file_metadata)
-        elif identifier.get('type') == 'tableMetadata':
-            return self.match_table_metadata(identifier, self.input_tables)
-        elif identifier.get('type') == 'tableHeader':
-            return self.match_table_header(identifier, self.input_tables)
+        return len(self.results)
+
+    def match_identifier(self, matcher):
+        if matcher.type == 'fileMetadata':
+            return self.match_file_metadata(matcher, self.file_metadata)
+        elif matcher.type == 'tableMetadata':
+            return self.match_table_metadata(matcher, self.input_tables)
+        elif matcher.type == 'tableHeader':
+            return self.match_table_header(matcher, self.input_tables)
         else:
             return False
 
-    def match_file_metadata(self, identifier, metadata):
-        input_key = identifier.get('key')
+    def match_file_metadata(self, matcher, metadata):
+        input_key = matcher.key
         input_value = metadata.get(input_key)
         if input_key and input_value:
-            value = self.match_value(identifier, input_value)
+            value = self.match_value(matcher, input_value)
             if value:
                 return {
                     'value': value
@@ -106,14 +179,14 @@ class Converter(object):
 
         return False
 
-    def match_table_metadata(self, identifier, input_tables):
-        input_table_index = identifier.get('tableIndex')
-        input_table = self.get_input_table(input_table_index, input_tables)
+    def match_table_metadata(self, matcher, input_tables):
+        input_table_index = matcher.table_index
+        input_table = self.get_input_table(matcher.table_position, input_tables)
         if input_table is not None:
-            input_key = identifier.get('key', None)
+            input_key = matcher.key
             input_value = input_table.get('metadata', {}).get(input_key, None)
             if input_key is not None and input_value is not None:
-                value = self.match_value(identifier, input_value)
+                value = self.match_value(matcher, input_value)
                 if value:
                     return {
                         'value': value,
@@ -122,36 +195,33 @@ class Converter(object):
 
         return False
 
-    def match_table_header(self, identifier, input_tables):
-        input_table_index = identifier.get('tableIndex')
-        input_table = self.get_input_table(input_table_index, input_tables)
+    def match_table_header(self, matcher, input_tables):
+        input_table_index = matcher.table_index
+        input_table = self.get_input_table(matcher.table_position, input_tables)
         if input_table is not None:
-            # try to get the line_number from the identifier
-            try:
-                line_number = int(identifier.get('lineNumber'))
-            except (ValueError, TypeError):
-                line_number = None
+            header_index = self.get_header_index(input_table)
 
+            line_number = matcher.line_number
             if line_number is None:
                 # use the whole header
-                header = os.linesep.join(input_table['header']).rstrip()
+                header = header_index.text
             else:
                 # use only the provided line
                 try:
                     # the interface counts from 1
-                    header = input_table['header'][line_number - 1].rstrip()
+                    header = header_index.get_line(line_number - 1)
                 except IndexError:
                     # the line in the header does not exist
                     return False
 
             if header:
                 # try to match the value
-                value = self.match_value(identifier, header)
+                value = header_index.match_value(self, matcher, line_number, header)
 
                 if value:
                     # if no line number was provided, find the line number for the value
                     if line_number is None:
-                        line_number = self.get_line_number(input_table['header'], value)
+                        line_number = header_index.get_line_number(value)
 
                     return {
                         'value': value,
@@ -161,13 +231,12 @@ class Converter(object):
 
         return False
 
-    def match_value(self, identifier, value):
+    def match_value(self, matcher, value):
         if value is not None:
             value = str(value)
-            if identifier.get('isRegex') or identifier.get('match') == 'regex':
-                pattern = identifier.get('value')
-                match = re.search(pattern, str(value))
-                logger.debug('match_value pattern="%s" value="%s" match=%s', pattern, value, bool(match))
+            if matcher.match == 'regex':
+                match = matcher.pattern.search(value)
+                logger.debug('match_value pattern="%s" value="%s" match=%s', matcher.value, value, bool(match))
                 if match:
                     try:
                         return match.group(1).strip()
@@ -175,24 +244,30 @@ class Converter(object):
                         return match.group(0).strip()
                 else:
                     return False
-            elif identifier.get('match') == 'any':
-                logger.debug('match_value identifier="%s", value="any" result=%s', identifier.get('value'), bool(value))
+            elif matcher.match == 'any':
+                logger.debug('match_value identifier="%s", value="any" result=%s', matcher.value, bool(value))
                 return value if value else False
 
             else:  # match == 'exact'
-                result = (value == str(identifier.get('value')))
-                logger.debug('match_value identifier="%s", value="%s" result=%s', identifier.get('value'), value, result)
+                result = (value == matcher.exact_value)
+                logger.debug('match_value identifier="%s", value="%s" result=%s', matcher.value, value, result)
                 return value if result else False
         else:
             return False
 
     def process(self):
+        self.input_columns = {}
+
         for output_table_index, output_table in enumerate(self.output_tables):
+            # with matchTables, all output tables are copies of the first table of the profile
+            profile_table_index = 0 if self.profile.data.get('matchTables') else output_table_index
+
             header = {}
             for key, value in output_table.get('header', {}).items():
                 if isinstance(value, dict):
                     # this is a table identifier, e.g. FIRSTX
-                    match = self.match_identifier(value)
+                    matcher = self.compiled_profile.get_header_matcher(profile_table_index, key, value)
+                    match = self.match_identifier(matcher)
                     if match:
                         header[key] = match['value']
                 else:
@@ -217,45 +292,14 @@ class Converter(object):
             x_operations = output_table.get('table', {}).get('xOperations', [])
             y_operations = output_table.get('table', {}).get('yOperations', [])
 
-            # repare rows
-            x_rows = []
-            y_rows = []
-            for operation in x_operations:
-                if operation.get('type') == 'column':
-                    operation['rows'] = []
-            for operation in y_operations:
-                if operation.get('type') == 'column':
-                    operation['rows'] = []
+            # gather the columns of the input tables, which are used by this output table
+            x_rows = self.get_column(x_column)
+            y_rows = self.get_column(y_column)
+            x_operation_rows = [self.get_operation_column(operation) for operation in x_operations]
+            y_operation_rows = [self.get_operation_column(operation) for operation in y_operations]
 
-            for table_index, table in enumerate(self.input_tables):
-                for row_index, row in enumerate(table['rows']):
-                    for column_index, column in enumerate(table['columns']):
-                        if x_column and \
-                                table_index == x_column.get('tableIndex') and \
-                                column_index == x_column.get('columnIndex'):
-                            x_rows.append(self.get_value(row, column_index))
-
-                        if y_column and \
-                                table_index == y_column.get('tableIndex') and \
-                                column_index == y_column.get('columnIndex'):
-                            y_rows.append(self.get_value(row, column_index))
-
-                        for operation in x_operations:
-                            if operation.get('type') == 'column' and \
-                                    table_index == operation.get('column', {}).get('tableIndex') and \
-                                    column_index == operation.get('column', {}).get('columnIndex'):
-                                operation['rows'].append(self.get_value(row, column_index))
-
-                        for operation in y_operations:
-                            if operation.get('type') == 'column' and \
-                                    table_index == operation.get('column', {}).get('tableIndex') and \
-                                    column_index == operation.get('column', {}).get('columnIndex'):
-                                operation['rows'].append(self.get_value(row, column_index))
-
-            for operation in x_operations:
-                x_rows = self.run_operation(x_rows, operation)
-            for operation in y_operations:
-                y_rows = self.run_operation(y_rows, operation)
+            x_rows = self.run_operations(x_rows, x_operations, x_operation_rows)
+            y_rows = self.run_operations(y_rows, y_operations, y_operation_rows)
 
             self.tables.append({
                 'header': header,
@@ -263,26 +307,62 @@ class Converter(object):
                 'y': y_rows
             })
 
-    def run_operation(self, rows, operation):
-        for i, row in enumerate(rows):
-            op_value = None
-            if operation.get('type') == 'column':
-                try:
-                    op_value = operation['rows'][i]
-                except IndexError:
-                    pass
-            elif operation.get('type') == 'value':
-                op_value = operation.get('value')
-
-            if op_value:
-                rows[i] = str(self.apply_operation(row, op_value, operation.get('operator')))
+    def run_operations(self, rows, operations, operations_rows):
+        # the floats of the rows are used for the whole chain of operations, values which can not be
+        # converted or computed are None and become 'None' in the end, rows which are not affected by
+        # any operation keep their original string and float
+        values = None
+        for operation, operation_rows in zip(map(Operation, operations), operations_rows):
+            if operation.type == 'value':
+                if not operation.value:
+                    continue
+            elif operation.type != 'column':
+                continue
+
+            if values is None:
+                values = list(rows.floats)
+                touched = bytearray(len(rows))
+
+            function = self.operators.get(operation.operator)
+            if operation.type == 'value':
+                operand = NumberColumn.parse_float(operation.float_value) if function else None
+                if operand is None:
+                    values = [None] * len(values)
+                elif None in values:
+                    values = [None if value is None else function(value, operand) for value in values]
+                else:
+                    values = list(map(function, values, itertools.repeat(operand)))
+                touched = bytearray(b'\x01' * len(values))
+            else:
+                # False marks the rows without a value in the operation column
+                operands = [operand if op_value else False
+                            for op_value, operand in zip(operation_rows[:len(values)], operation_rows.floats)]
+                values[:len(operands)] = [
+                    value if operand is False else
+                    None if value is None or operand is None or function is None else
+                    function(value, operand)
+                    for value, operand in zip(values, operands)
+                ]
+                for i, operand in enumerate(operands):
+                    if operand is not False:
+                        touched[i] = 1
+
+        if values is None:
+            return rows
+        elif touched.count(0) == 0:
+            if None not in values:
+                return NumberColumn(map(repr, values), values)
+        else:
+            values = [value if is_touched else original for value, original, is_touched in zip(values, rows.floats, touched)]
 
-        return rows
+        return NumberColumn([
+            ('None' if value is None else repr(value)) if is_touched else row
+            for row, value, is_touched in zip(rows, values, touched)
+        ], values)
 
     def run_identifier_operation(self, value, operation):
-        op_value = operation.get('value')
-        if op_value:
-            return self.apply_operation(value, op_value, operation.get('operator'))
+        if operation.value:
+            return self.apply_operation(value, operation.float_value, operation.operator)
         else:
             return value
 
@@ -301,6 +381,47 @@ class Converter(object):
         except ValueError:
             return None
 
+    def get_column(self, column):
+        # find the input table and the column, which match the tableIndex and columnIndex of the profile,
+        # and gather the values of this column, the columns are gathered only once for every process()
+        if column:
+            for table_index, table in enumerate(self.input_tables):
+                if table_index == column.get('tableIndex'):
+                    for column_index, _ in enumerate(table['columns']):
+                        if column_index == column.get('columnIndex'):
+                            key = (table_index, column_index)
+                            if key not in self.input_columns:
+                                self.input_columns[key] = self.get_column_values(table['rows'], column_index)
+
+                            return self.input_columns[key]
+
+        return NumberColumn()
+
+    def get_operation_column(self, operation):
+        if operation.get('type') == 'column':
+            return self.get_column(operation.get('column', {}))
+        else:
+            return NumberColumn()
+
+    def get_column_values(self, rows, column_index):
+        if isinstance(rows, TableRows):
+            column = rows.column(column_index)
+            if isinstance(column, FloatColumn):
+                if column.decimal is not None:
+                    # strings with a fixed number of decimals need no fixing, they all
+                    # have these decimals after a period, unless they are inf or nan
+                    if column.decimal > 0 and all(map(math.isfinite, column.values)):
+                        decimal = column.decimal
+                    else:
+                        decimal = None
+                    return NumberColumn(column, list(column.values), decimal)
+                else:
+                    return NumberColumn(map(self.fix_float, column), list(column.values))
+            else:
+                return NumberColumn(map(self.fix_float, column))
+        else:
+            return NumberColumn(self.get_value(row, column_index) for row in rows)
+
     def get_input_table(self, index, input_tables):
         if index is not None:
             try:
@@ -311,12 +432,11 @@ class Converter(object):
             except KeyError:
                 return None
 
-    def get_line_number(self, header, value):
-        # if line_number is None:
-        for i, line in enumerate(header):
-            if value in line:
-                # again we count from 1
-                return i + 1
+    def get_header_index(self, input_table):
+        key = id(input_table)
+        if key not in self.header_indexes:
+            self.header_indexes[key] = HeaderIndex(input_table['header'])
+        return self.header_indexes[key]
 
     def get_value(self, row, column_index):
         return self.fix_float(row[column_index])
@@ -326,11 +446,91 @@ class Converter(object):
 
     @classmethod
     def match_profile(cls, client_id, file_data):
+        profiles = Profile.list(client_id)
+        candidates = cls.get_candidates(profiles, file_data)
+
+        # the profile which won for files with the same fingerprint is checked first
+        if profiles.memo is None:
+            profiles.memo = ProfileMemo()
+
+        fingerprint = profiles.memo.get_fingerprint(file_data)
+        converter = cls.match_memo(candidates, profiles.memo.get(fingerprint), file_data)
+        if converter is False:
+            converter = cls.match_all(client_id, candidates, file_data)
+
+        profiles.memo.store(fingerprint, converter)
+        return converter
+
+    @classmethod
+    def match_all(cls, client_id, candidates, file_data):
+        # large numbers of profiles can be matched in parallel by a pool of processes,
+        # the winning profile is matched here again to create its converter
+        workers = int(current_app.config['MATCH_WORKERS'])
+        if workers > 1 and len(candidates) >= cls.parallel_min_profiles:
+            profiles_path = Path(current_app.config['PROFILES_DIR']).joinpath(client_id)
+            cache_size = int(current_app.config['PROFILES_CACHE_SIZE'])
+
+            result = match_pool.match(profiles_path, client_id, cache_size, file_data, len(candidates), workers)
+            if result is not None:
+                position, profile_id = result
+                if position is None:
+                    return None
+                elif candidates[position].id == profile_id:
+                    return cls.match_candidates(candidates[position:position + 1], file_data)
+
+            # the pool failed or the profiles changed in the meantime, fall back to the serial matching
+
+        return cls.match_candidates(candidates, file_data)
+
+    @classmethod
+    def get_candidates(cls, profiles, file_data):
+        if profiles.prefilter is None:
+            profiles.prefilter = ProfilePrefilter(profiles)
+
+        return profiles.prefilter.filter(file_data.get('metadata', {}))
+
+    @classmethod
+    def match_memo(cls, candidates, profile_id, file_data):
+        # match the remembered profile, and then only the profiles which could still win against
+        # it, since they have more identifiers, or as many identifiers and come first, returns
+        # False if there is no remembered profile or if it does not match anymore
+        for position, profile in enumerate(candidates):
+            if profile.id == profile_id:
+                break
+        else:
+            return False
+
+        header_indexes = {}
+        converter = cls(profile, file_data, header_indexes)
+        matches = converter.match()
+
+        logger.info('profile=%s matches=%s (memo)', profile.id, matches)
+
+        if not matches:
+            return False
+
+        tables_count = len(file_data.get('tables', []))
+        rivals = []
+        for rival_position, rival in enumerate(candidates):
+            rival_count = CompiledProfile.get(rival).get_count(tables_count)
+            if rival_count > matches or (rival_count == matches and rival_position < position):
+                rivals.append(rival)
+
+        rival_converter = cls.match_candidates(rivals, file_data, header_indexes)
+        return converter if rival_converter is None else rival_converter
+
+    @classmethod
+    def match_candidates(cls, profiles, file_data, header_indexes=None):
+        # return the converter for the profile with the most matches, if
+        # two profiles have the same number of matches, the first one wins
         converter = None
         matches = 0
 
-        for profile in Profile.list(client_id):
-            current_converter = cls(profile, file_data)
+        if header_indexes is None:
+            header_indexes = {}
+
+        for profile in profiles:
+            current_converter = cls(profile, file_data, header_indexes)
             current_matches = current_converter.match()
 
             logger.info('profile=%s matches=%s', profile.id, current_matches)
@@ -340,3 +540,337 @@ class Converter(object):
                 matches = current_matches
 
         return converter
+
+
+class MatchPool(ProcessPool):
+    # a pool of processes, which match chunks of the profiles of a client, the processes
+    # load the profiles using their own profile cache and get the file data without the rows,
+    # a broken pool is not started again, the profiles are matched serially from now on
+
+    def match(self, profiles_path, client_id, cache_size, file_data, count, workers):
+        # returns the position and the id of the winning profile, (None, None) if no profile
+        # matched, or None if the pool could not be used
+        match_data = {
+            'metadata': file_data.get('metadata', {}),
+            'tables': [{key: value for key, value in table.items() if key != 'rows'}
+                       for table in file_data.get('tables', [])]
+        }
+
+        executor = self.get_executor()
+        if executor is None:
+            return None
+
+        chunk_size = -(-count // workers)
+        try:
+            futures = [
+                self.submit(executor, match_chunk, profiles_path, client_id, cache_size, match_data, count, start, start + chunk_size)
+                for start in range(0, count, chunk_size)
+            ]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            logger.exception('the match pool is broken')
+            self.reset(executor)
+            return None
+
+        # the chunks are in order, so the first profile still wins a tie
+        best = (None, None, 0)
+        for result in results:
+            if result is None:
+                # the profiles in the process differ from the profiles here
+                return None
+            if result[2] > best[2]:
+                best = result
+
+        return best[:2]
+
+
+def match_chunk(profiles_path, client_id, cache_size, file_data, count, start, stop):
+    # runs in the processes of the MatchPool
+    profiles = profile_cache.get(profiles_path, client_id, cache_size)
+    candidates = Converter.get_candidates(profiles, file_data)
+    if len(candidates) != count:
+        return None
+
+    converter = Converter.match_candidates(candidates[start:stop], file_data)
+    if converter is None:
+        return None, None, 0
+    else:
+        position = start + candidates[start:stop].index(converter.profile)
+        return position, converter.profile.id, len(converter.results)
+
+
+match_pool = MatchPool()
+
+
+class ProfileMemo(object):
+    # remembers the winning profiles for the fingerprints of recent files, the memo is kept with the
+    # list of profiles of a client (see ProfileList), so it is dropped when one of the profiles changes
+
+    size = 256
+
+    # the key of a header line, i.e. the text before the first separator, e.g. "Date" of "Date: 2021-01-01"
+    header_key_pattern = re.compile(r'[^:=\t,;]*')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profile_ids = OrderedDict()
+
+    def get_fingerprint(self, file_data):
+        # the reader and the extension, and a hash of the header signature, i.e. the keys of the file
+        # metadata, and the keys of the header lines, the metadata keys and the column names of every
+        # table, so that files of the same kind share a fingerprint, while the values in them can differ
+        metadata = file_data.get('metadata', {})
+
+        signature = [sorted(metadata.keys())]
+        for table in file_data.get('tables', []):
+            signature.append([
+                [self.header_key_pattern.match(str(line)).group(0).strip() for line in table.get('header', [])],
+                sorted(table.get('metadata', {}).keys()),
+                [column.get('name') for column in table.get('columns', [])]
+            ])
+
+        return (
+            metadata.get('reader'),
+            metadata.get('extension'),
+            hashlib.sha256(json.dumps(signature, default=str).encode()).hexdigest()
+        )
+
+    def get(self, fingerprint):
+        with self.lock:
+            profile_id = self.profile_ids.get(fingerprint)
+            if profile_id is not None:
+                self.profile_ids.move_to_end(fingerprint)
+            return profile_id
+
+    def store(self, fingerprint, converter):
+        with self.lock:
+            if converter is None:
+                self.profile_ids.pop(fingerprint, None)
+            else:
+                self.profile_ids[fingerprint] = converter.profile.id
+                self.profile_ids.move_to_end(fingerprint)
+                while len(self.profile_ids) > self.size:
+                    self.profile_ids.popitem(last=False)
+
+
+class HeaderIndex(object):
+    # the header of an input table prepared for matching, the joined header and the offsets of
+    # the lines are computed once, and the results of regex identifiers and the line numbers of
+    # values are stored, so that they are reused by the identifiers of all profiles
+
+    def __init__(self, header):
+        self.header = header
+        self.results = {}
+        self.line_numbers = {}
+        self._joined = None
+        self._text = None
+        self._offsets = None
+
+    @property
+    def joined(self):
+        if self._joined is None:
+            self._joined = os.linesep.join(self.header)
+        return self._joined
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.joined.rstrip()
+        return self._text
+
+    @property
+    def offsets(self):
+        # the positions of the lines in the joined header
+        if self._offsets is None:
+            self._offsets = []
+            offset = 0
+            for line in self.header:
+                self._offsets.append(offset)
+                offset += len(line) + len(os.linesep)
+        return self._offsets
+
+    def get_line(self, index):
+        return self.header[index].rstrip()
+
+    def match_value(self, converter, matcher, line_number, header):
+        if matcher.match != 'regex':
+            return converter.match_value(matcher, header)
+
+        key = (matcher.value, line_number)
+        if key not in self.results:
+            self.results[key] = converter.match_value(matcher, header)
+        return self.results[key]
+
+    def get_line_number(self, value):
+        if value not in self.line_numbers:
+            self.line_numbers[value] = self.find_line_number(value)
+        return self.line_numbers[value]
+
+    def find_line_number(self, value):
+        # find the first line which contains the value, an occurence of the value in the
+        # joined header is only valid if it does not extend over the end of the line
+        position = self.joined.find(value)
+        while position >= 0:
+            index = bisect.bisect_right(self.offsets, position) - 1
+            if position + len(value) <= self.offsets[index] + len(self.header[index]):
+                # again we count from 1
+                return index + 1
+
+            position = self.joined.find(value, position + 1)
+
+
+class ProfilePrefilter(object):
+    # an index of the profiles by their non optional fileMetadata identifiers with exact matching,
+    # profiles where one of these identifiers can't match the file metadata are skipped
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.required = []
+        self.index = defaultdict(lambda: defaultdict(list))
+
+        for position, profile in enumerate(profiles):
+            pairs = set(self.get_pairs(profile))
+            self.required.append(len(pairs))
+            for key, value in pairs:
+                self.index[key][value].append(position)
+
+    def get_pairs(self, profile):
+        for identifier in profile.data.get('identifiers', []):
+            if identifier.get('type') == 'fileMetadata' and identifier.get('key') and \
+                    not identifier.get('optional') and not identifier.get('isRegex') and \
+                    identifier.get('match') not in ['regex', 'any']:
+                if profile.data.get('matchTables') and identifier.get('outputTableIndex') is not None:
+                    # this identifier is copied for every input table by the converter
+                    continue
+
+                yield identifier['key'], str(identifier.get('value'))
+
+    def filter(self, metadata):
+        # count for every profile how many of its identifiers match the metadata
+        hits = [0] * len(self.profiles)
+        for key, values in self.index.items():
+            value = metadata.get(key)
+            if value:
+                for position in values.get(str(value), []):
+                    hits[position] += 1
+
+        return [profile for profile, required, hit in zip(self.profiles, self.required, hits) if hit == required]
+
+
+class CompiledProfile(object):
+    # the identifiers of a profile prepared for matching, a profile is compiled once
+    # after it was loaded and the compiled profile is kept as long as the profile exists
+
+    compiled_profiles = weakref.WeakKeyDictionary()
+
+    def __init__(self, profile_data):
+        self.data = profile_data
+        self.matchers = [IdentifierMatcher(identifier) for identifier in profile_data.get('identifiers', [])]
+        self.header_matchers = {}
+
+        # a converter has one matcher for every identifier, with matchTables the identifiers
+        # with an outputTableIndex are used for every input table (see Converter.__init__)
+        if profile_data.get('matchTables'):
+            self.table_count = len([matcher for matcher in self.matchers
+                                    if matcher.identifier.get('outputTableIndex') is not None])
+        else:
+            self.table_count = 0
+        self.count = len(self.matchers) - self.table_count
+
+    def get_count(self, tables_count):
+        # the number of matches, if the profile matches a file with this number of tables
+        return self.count + self.table_count * tables_count
+
+    def get_header_matcher(self, table_index, key, identifier):
+        if (table_index, key) not in self.header_matchers:
+            self.header_matchers[(table_index, key)] = IdentifierMatcher(identifier)
+        return self.header_matchers[(table_index, key)]
+
+    @classmethod
+    def get(cls, profile):
+        compiled_profile = cls.compiled_profiles.get(profile)
+        if compiled_profile is None or compiled_profile.data is not profile.data:
+            compiled_profile = cls.compiled_profiles[profile] = cls(profile.data)
+        return compiled_profile
+
+
+class IdentifierMatcher(object):
+    # an identifier of a profile, where the regex is compiled and the table index, the line number,
+    # and the values of the operations are converted once, values which can't be converted are kept,
+    # so that the errors occur (or are handled) when the identifier is used, like before
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+        self.type = identifier.get('type')
+        self.key = identifier.get('key')
+        self.value = identifier.get('value')
+        self.exact_value = str(self.value)
+        self.optional = bool(identifier.get('optional'))
+
+        if identifier.get('isRegex') or identifier.get('match') == 'regex':
+            self.match = 'regex'
+        elif identifier.get('match') == 'any':
+            self.match = 'any'
+        else:
+            self.match = 'exact'
+
+        try:
+            self.line_number = int(identifier.get('lineNumber'))
+        except (ValueError, TypeError):
+            self.line_number = None
+
+        self.set_table_index(identifier.get('tableIndex'))
+
+        # the cost of the identifier, the cheaper identifiers are checked first
+        if self.type == 'tableMetadata':
+            self.cost = 1
+        elif self.type == 'tableHeader':
+            self.cost = 3 if self.match == 'regex' else 2
+        else:
+            self.cost = 0
+
+        # the regex and the operations are prepared when they are used for the first time,
+        # and they are shared with all copies of this matcher
+        self.base = self
+        self._pattern = None
+        self._operations = None
+
+    def set_table_index(self, table_index):
+        self.table_index = table_index
+        try:
+            self.table_position = None if table_index is None else int(table_index)
+        except (ValueError, TypeError):
+            self.table_position = table_index
+
+    def for_table(self, input_table_index):
+        # the copy shares the compiled regex and operations, but the (input) tableIndex
+        # is adjusted to the input table, if it was not null (see Converter.identifiers)
+        matcher = copy.copy(self)
+        if self.table_index is not None:
+            matcher.set_table_index(input_table_index)
+        return matcher
+
+    @property
+    def pattern(self):
+        if self.base._pattern is None:
+            self.base._pattern = re.compile(self.value)
+        return self.base._pattern
+
+    @property
+    def operations(self):
+        if self.base._operations is None:
+            self.base._operations = [Operation(operation) for operation in self.identifier.get('operations', [])]
+        return self.base._operations
+
+
+class Operation(object):
+
+    def __init__(self, operation):
+        self.type = operation.get('type')
+        self.operator = operation.get('operator')
+        self.value = operation.get('value')
+
+        try:
+            self.float_value = float(self.value)
+        except (ValueError, TypeError):
+            self.float_value = self.value
@@ -1,7 +1,20 @@
+import codecs
+import csv
+import hashlib
+import io
 import json
 import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
-from collections import defaultdict
+from array import array
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from operator import itemgetter
 from pathlib import Path
 
 import magic
@@ -11,6 +24,137 @@ from .utils import check_uuid
 
 logger = logging.getLogger(__name__)
 
+# the libmagic handle is created only once per process, since creating it loads
+# the magic database, python-magic serializes the calls to the handle using a lock
+magic_lock = threading.Lock()
+magic_handle = None
+
+
+def get_file_type(buffer):
+    global magic_handle
+
+    with magic_lock:
+        if magic_handle is None:
+            magic_handle = magic.Magic(mime=True, mime_encoding=True)
+
+    mime_type, _, encoding = magic_handle.from_buffer(buffer).partition('; charset=')
+    return mime_type, encoding
+
+
+class ProfileCache(object):
+    # caches the profiles of the clients in this process, i.e. every (gunicorn) worker has its own cache,
+    # and changes by other processes are only noticed using the stat() of the files: the list of profiles
+    # of a client is read again if its directory changes (a profile was added or removed), single profiles
+    # are loaded again if their mtime, size or inode changes, the least recently used clients are removed
+    # first, since the mtime can be coarse, a file which was modified shortly before it was read (see
+    # racy_interval) could have been modified again in the same tick and is checked again next time
+
+    racy_interval = 2 * 10**9
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, profiles_path, client_id, size):
+        key = str(profiles_path)
+
+        checked = time.time_ns()
+        try:
+            stat = profiles_path.stat()
+        except FileNotFoundError:
+            self.invalidate(profiles_path)
+            return ProfileList()
+
+        stat_key = self.get_stat_key(stat)
+        racy = self.is_racy(stat, checked)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None or entry['stat'] != stat_key or entry['racy']:
+            file_paths = list(Path.iterdir(profiles_path))
+            changed = entry is None or sorted(file_paths) != sorted(entry['files'].keys())
+        else:
+            file_paths = list(entry['files'].keys())
+            changed = False
+
+        files = OrderedDict()
+        for file_path in file_paths:
+            try:
+                file_stat = file_path.stat()
+            except FileNotFoundError:
+                changed = True
+                continue
+
+            file_key = self.get_stat_key(file_stat)
+            cached = entry['files'].get(file_path) if entry is not None else None
+            if cached is not None and cached[0] == file_key and not cached[1]:
+                files[file_path] = cached
+            else:
+                profile_id = str(file_path.with_suffix('').name)
+                profile_data = Profile.load(file_path)
+                profile = Profile(profile_data, client_id, profile_id)
+
+                if cached is not None and cached[2].data == profile.data:
+                    # the racy file did not change, the profile is kept
+                    profile = cached[2]
+                else:
+                    changed = True
+
+                files[file_path] = (file_key, self.is_racy(file_stat, checked), profile)
+
+        if changed:
+            # the list is only created again if a profile has changed, so that
+            # data which is derived from the list can be kept with the list
+            profiles = ProfileList(profile for _, _, profile in files.values())
+        else:
+            profiles = entry['profiles']
+
+        with self.lock:
+            self.entries[key] = {
+                'stat': stat_key,
+                'racy': racy,
+                'files': files,
+                'profiles': profiles
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+        return profiles
+
+    def get_stat_key(self, stat):
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def is_racy(self, stat, checked):
+        return checked - stat.st_mtime_ns < self.racy_interval
+
+    def invalidate(self, profiles_path):
+        with self.lock:
+            self.entries.pop(str(profiles_path), None)
+
+
+profile_cache = ProfileCache()
+
+
+class ProfileList(list):
+    # a list of profiles, which also holds data derived from the profiles (e.g. the prefilter and the
+    # memo used by Converter.match_profile), the list is cached until one of the profiles changes
+
+    prefilter = None
+    memo = None
+    _version = None
+
+    @property
+    def version(self):
+        # a hash of the ids and the data of the profiles, which is the same in every process
+        if self._version is None:
+            sha256 = hashlib.sha256()
+            for profile in sorted(self, key=lambda profile: profile.id or ''):
+                sha256.update(json.dumps([profile.id, profile.data], sort_keys=True).encode())
+            self._version = sha256.hexdigest()
+        return self._version
+
 
 class Profile(object):
 
@@ -78,6 +222,8 @@ class Profile(object):
         with open(file_path, 'w') as fp:
             json.dump(self.data, fp, sort_keys=True, indent=4)
 
+        profile_cache.invalidate(profiles_path)
+
     def delete(self):
         profiles_path = Path(current_app.config['PROFILES_DIR']).joinpath(self.client_id)
 
@@ -85,6 +231,8 @@ class Profile(object):
         if file_path.is_file():
             file_path.unlink()
 
+        profile_cache.invalidate(profiles_path)
+
     @property
     def as_dict(self):
         return {
@@ -110,14 +258,10 @@ class Profile(object):
     @classmethod
     def list(cls, client_id):
         profiles_path = Path(current_app.config['PROFILES_DIR']).joinpath(client_id)
+        cache_size = int(current_app.config['PROFILES_CACHE_SIZE'])
 
-        if profiles_path.exists():
-            for file_path in Path.iterdir(profiles_path):
-                profile_id = str(file_path.with_suffix('').name)
-                profile_data = cls.load(file_path)
-                yield cls(profile_data, client_id, profile_id)
-        else:
-            return []
+        # the profiles are shared with the cache and must not be altered
+        return profile_cache.get(profiles_path, client_id, cache_size)
 
     @classmethod
     def retrieve(cls, client_id, profile_id):
@@ -135,18 +279,463 @@ class Profile(object):
 
 class File(object):
 
+    chunk_size = 1024 * 1024
+
     def __init__(self, file):
         self.fp = file
         self.name = file.filename
         self.content_type = file.content_type
 
-        # read the file
-        self.content = file.read()
+        # read the file, large files are not read into memory, but kept
+        # in a temporary file, which is mapped into memory (read only)
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
         file.seek(0)
 
-        self.mime_type = magic.Magic(mime=True).from_buffer(self.content)
-        self.encoding = magic.Magic(mime_encoding=True).from_buffer(self.content)
+        if size > int(current_app.config['SPOOL_SIZE']):
+            self.content = self.map(file)
+        else:
+            self.content = file.read()
+            file.seek(0)
+
         self.suffix = Path(self.name).suffix
 
-        # decode file string
-        self.string = self.content.decode(self.encoding) if self.encoding != 'binary' else None
+        # detect the mime type and the encoding using only the first bytes of text files, the whole
+        # file is used for all other files (e.g. an .xlsx file is only a zip file in the first bytes),
+        # and if the result does not fit the rest of the file
+        self._string = None
+        prefix = self.get_prefix(int(current_app.config['MAGIC_BUFFER_SIZE']))
+        self.mime_type, self.encoding = get_file_type(prefix)
+
+        if len(prefix) < len(self.content) and not self.check_prefix_type():
+            self.mime_type, self.encoding = get_file_type(self.content[:])
+
+        # the lines and csv rows are computed once and shared between all readers
+        self._lines = None
+        self._csv_rows = None
+
+    @property
+    def string(self):
+        # the file string is decoded when it is used for the first time
+        if self._string is None and self.encoding != 'binary':
+            self._string = str(self.content, self.encoding)
+        return self._string
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = self.string.splitlines() if self.string is not None else []
+        return self._lines
+
+    @property
+    def csv_rows(self):
+        # the csv_dialect is set by the CSVReader (see CSVReader.check_csv)
+        if self._csv_rows is None:
+            self._csv_rows = list(csv.reader(io.StringIO(self.string), self.csv_dialect))
+        return self._csv_rows
+
+    def map(self, file):
+        try:
+            fileno = file.stream.fileno()
+            return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError):
+            # the upload is not stored in a file, so we copy it to a temporary file, which is
+            # removed once the map is closed, since the map keeps its own file descriptor
+            with tempfile.TemporaryFile() as spool:
+                shutil.copyfileobj(file.stream, spool)
+                spool.flush()
+                file.seek(0)
+                return mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_prefix(self, size):
+        prefix = self.content[:size]
+        if len(prefix) < len(self.content):
+            # cut the prefix after the last line break, so that no character is cut in half
+            index = prefix.rfind(b'\n')
+            if index > 0:
+                if prefix[index + 1:index + 2] == b'\x00':
+                    # the line break of utf-16le
+                    index += 1
+                prefix = prefix[:index + 1]
+
+        return prefix
+
+    def check_prefix_type(self):
+        if not self.mime_type.startswith('text/') or self.encoding == 'binary':
+            # the type of binary and container files can depend on more than the prefix
+            return False
+
+        if 'utf-16' not in self.encoding and 'utf-32' not in self.encoding and self.content.find(b'\x00') >= 0:
+            # null bytes after the prefix would make this a binary file
+            return False
+
+        try:
+            if isinstance(self.content, bytes):
+                # the file string is kept, if the whole file can be decoded
+                self._string = str(self.content, self.encoding)
+            else:
+                # a mapped file is decoded in chunks, without keeping the string
+                decoder = codecs.getincrementaldecoder(self.encoding)()
+                for index in range(0, len(self.content), self.chunk_size):
+                    decoder.decode(self.content[index:index + self.chunk_size])
+                decoder.decode(b'', final=True)
+            return True
+        except UnicodeDecodeError:
+            return False
+
+
+@contextmanager
+def open_atomic(path, mode='wb'):
+    # opens a temporary file next to the path, which replaces the path once it was written
+    # completely, so that other processes never see a partial file, the temporary file is
+    # removed if writing fails
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fp:
+            yield fp
+
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def touch_file(path):
+    # marks the file as used for evict_files
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # the file was just removed by another process
+        pass
+
+
+def remove_file(path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def evict_files(file_paths, size, ttl=None):
+    # removes the files which were used least recently (mtime) until all files together are not larger
+    # than size, files starting with a period (temporary files) are skipped, with a ttl, all files which
+    # were not used for ttl seconds are removed first, including temporary files which were left behind
+    entries = []
+    for file_path in file_paths:
+        try:
+            file_stat = file_path.stat()
+        except FileNotFoundError:
+            continue
+
+        if ttl is not None and time.time() - file_stat.st_mtime > ttl:
+            remove_file(file_path)
+        elif not file_path.name.startswith('.'):
+            entries.append((file_stat.st_mtime_ns, file_stat.st_size, file_path))
+
+    total = sum(entry[1] for entry in entries)
+    for _, file_size, file_path in sorted(entries):
+        if total <= size:
+            break
+
+        remove_file(file_path)
+        total -= file_size
+
+
+class ConversionCache(object):
+    # caches the output of /conversions on disk, the files are named by a hash of everything the output
+    # depends on, they are written to a temporary file first and renamed afterwards, so that several
+    # processes can share the directory, the files which were used least recently (mtime) are removed first
+
+    chunk_size = 1024 * 1024
+
+    # the version of the keys, and the settings which change the output, are part of every key
+    version = 1
+    config_keys = ['ZIP_COMPRESSLEVEL']
+
+    def get_key(self, *parts):
+        config = [current_app.config[config_key] for config_key in self.config_keys]
+        return hashlib.sha256(json.dumps([self.version, config, *parts]).encode()).hexdigest()
+
+    def get_upload_hash(self, upload):
+        # the upload could have been read already (e.g. by a reader), so the stream is
+        # rewound before and after the hash is computed
+        sha256 = hashlib.sha256()
+        upload.stream.seek(0)
+        for chunk in iter(lambda: upload.stream.read(self.chunk_size), b''):
+            sha256.update(chunk)
+        upload.stream.seek(0)
+        return sha256.hexdigest()
+
+    def get_path(self, key):
+        return Path(current_app.config['CONVERSIONS_CACHE_DIR']).joinpath(key)
+
+    def open(self, key):
+        path = self.get_path(key)
+        try:
+            fp = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        # the file could be removed by another process now, but it is still open here
+        touch_file(path)
+        return fp
+
+    def read(self, fp):
+        with fp:
+            yield from iter(lambda: fp.read(self.chunk_size), b'')
+
+    def store(self, key, chunks):
+        # yields the chunks and writes them to a temporary file, which is only
+        # added to the cache, once all chunks were written successfully
+        path = self.get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open_atomic(path) as fp:
+            for chunk in chunks:
+                fp.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                yield chunk
+
+        evict_files(path.parent.iterdir(), int(current_app.config['CONVERSIONS_CACHE_SIZE']))
+
+
+conversion_cache = ConversionCache()
+
+
+class TableStore(object):
+    # stores the parsed tables of uploads (see /tables) on disk, so that /conversions can use them with
+    # a handle instead of reading the file again, the handles are random uuids in a directory for each
+    # client, files which were not used for TABLES_STORE_TTL seconds are removed, as well as the least
+    # recently used files, if all files together are larger than TABLES_STORE_SIZE, the tables are
+    # stored as JSON (and packed again when they are loaded), so that loading a file runs no code
+
+    def get_path(self, client_id):
+        return Path(current_app.config['TABLES_STORE_DIR']).joinpath(client_id)
+
+    def store(self, client_id, data):
+        handle = str(uuid.uuid4())
+
+        path = self.get_path(client_id)
+        path.mkdir(parents=True, exist_ok=True)
+
+        with open_atomic(path.joinpath(handle), 'w') as fp:
+            json.dump(data, fp, default=self.encode)
+
+        evict_files(Path(current_app.config['TABLES_STORE_DIR']).glob('*/*'),
+                    int(current_app.config['TABLES_STORE_SIZE']), int(current_app.config['TABLES_STORE_TTL']))
+        return handle
+
+    def load(self, client_id, handle):
+        handle_uuid = check_uuid(handle)
+        if not handle_uuid:
+            return None
+
+        file_path = self.get_path(client_id).joinpath(str(handle_uuid))
+        try:
+            with open(file_path) as fp:
+                if time.time() - os.fstat(fp.fileno()).st_mtime > int(current_app.config['TABLES_STORE_TTL']):
+                    return None
+
+                data = json.load(fp)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # not a file of the store
+            return None
+
+        data['data']['tables'] = [self.decode_table(table) for table in data['data']['tables']]
+
+        touch_file(file_path)
+        return data
+
+    def encode(self, value):
+        # the rows of the tables are stored as lists, other values (e.g. the dates
+        # in the header of excel files) as strings
+        if isinstance(value, TableRows):
+            return list(value)
+        else:
+            return str(value)
+
+    def decode_table(self, data):
+        table = Table()
+        table.update(data)
+        table.pack()
+        return table
+
+
+table_store = TableStore()
+
+
+class Table(dict):
+
+    def __init__(self):
+        super().__init__(header=[], metadata={}, columns=[], rows=[])
+
+    def pack(self):
+        # once the table is complete, the list of rows is replaced by a columnar
+        # storage, rows with different numbers of cells are kept as a list
+        if isinstance(self['rows'], list):
+            rows = TableRows.pack(self['rows'])
+            if rows is not None:
+                self['rows'] = rows
+
+
+class TableRows(object):
+    # the rows of a table stored column by column, rows are only created when they
+    # are accessed and behave like the lists of cells which were put into the table
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('row index out of range')
+
+        return [column[index] for column in self.columns]
+
+    def __iter__(self):
+        if self.columns:
+            return map(list, zip(*self.columns))
+        else:
+            return ([] for _ in range(self.length))
+
+    def column(self, index):
+        return self.columns[index]
+
+    @classmethod
+    def pack(cls, rows):
+        if not rows or len(set(map(len, rows))) != 1:
+            return None
+
+        columns = []
+        for index in range(len(rows[0])):
+            column = list(map(itemgetter(index), rows))
+            if set(map(type, column)) == {str}:
+                columns.append(FloatColumn.pack(column) or column)
+            else:
+                columns.append(column)
+
+        return cls(columns, len(rows))
+
+
+class FloatColumn(object):
+    # a column of numeric strings, which are stored as floats together with the number of
+    # decimals needed to format the float back into the same string, the decimals are -1
+    # if repr() gives the string, and -2 if the string has to be kept as it is
+
+    max_decimals = 127
+
+    def __init__(self, values, decimals, strings, decimal=None):
+        self.values = values
+        self.decimals = decimals
+        self.strings = strings
+
+        # the number of decimals, if it is the same for all strings
+        self.decimal = decimal
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.values)
+
+        decimal = self.decimals[index]
+        if decimal >= 0:
+            return '%.*f' % (decimal, self.values[index])
+        elif decimal == -1:
+            return repr(self.values[index])
+        else:
+            return self.strings[index]
+
+    def __iter__(self):
+        if self.decimal is not None:
+            return iter(self.format(self.values, self.decimal).split('\x00'))
+        else:
+            return self.iter_strings()
+
+    def iter_strings(self):
+        for index, (decimal, value) in enumerate(zip(self.decimals, self.values)):
+            if decimal >= 0:
+                yield '%.*f' % (decimal, value)
+            elif decimal == -1:
+                yield repr(value)
+            else:
+                yield self.strings[index]
+
+    @classmethod
+    def format(cls, values, decimal):
+        # format all values with the same number of decimals in one go, separated by null bytes
+        return ('%.{}f\x00'.format(decimal) * len(values) % tuple(values))[:-1]
+
+    @classmethod
+    def pack(cls, column):
+        try:
+            values = array('d', map(float, column))
+        except ValueError:
+            return None
+
+        # first, try the number of decimals of the first string for the whole column
+        decimal = len(column[0].partition('.')[2])
+        if decimal <= cls.max_decimals and cls.format(values, decimal) == '\x00'.join(column):
+            return cls(values, array('b', [decimal]) * len(values), {}, decimal)
+
+        # otherwise, the number of decimals is the length after the period, the floats are
+        # formatted for the whole column and only the differing strings are checked again
+        decimals = [min(len(string.partition('.')[2]), cls.max_decimals) for string in column]
+        formatted = list(map('%.*f'.__mod__, zip(decimals, values)))
+
+        strings = {}
+        if formatted != column:
+            for index, string in enumerate(column):
+                if formatted[index] != string:
+                    if repr(values[index]) == string:
+                        decimals[index] = -1
+                    else:
+                        decimals[index] = -2
+                        strings[index] = string
+
+            if len(strings) > len(column) // 2:
+                # the column can't be stored more efficiently
+                return None
+
+        return cls(values, array('b', decimals), strings)
+
+
+class NumberColumn(list):
+    # the strings of a column, which the converter passes to the writers, together with
+    # their floats (None if a string is not a number) and the number of decimals after the
+    # period, if it is the same for all strings, so that the strings are not parsed again
+
+    def __init__(self, strings=(), floats=None, decimal=None):
+        super().__init__(strings)
+        self._floats = floats
+        self.decimal = decimal
+
+    @property
+    def floats(self):
+        if self._floats is None:
+            self._floats = self.parse(self)
+        return self._floats
+
+    @classmethod
+    def parse(cls, strings):
+        try:
+            return list(map(float, strings))
+        except ValueError:
+            return [cls.parse_float(string) for string in strings]
+
+    @staticmethod
+    def parse_float(string):
+        try:
+            return float(string)
+        except ValueError:
+            return None
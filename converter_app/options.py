@@ -74,9 +74,18 @@ YUNITS = (
     'Molar Extinction (cm2/mmol) '
 )
 
+XYDATA_ENCODINGS = (
+    'AFFN',
+    'SQZ',
+    'SQZDUP',
+    'DIF',
+    'DIFDUP'
+)
+
 OPTIONS = {
     'DATA TYPE': DATA_TYPES,
     'DATA CLASS': DATA_CLASSES,
     'XUNITS': XUNITS,
     'YUNITS': YUNITS,
+    'XYDATA ENCODING': XYDATA_ENCODINGS,
 }
@@ -22,10 +22,19 @@ logger = logging.getLogger(__name__)
 
 class Readers:
 
+    index_keys = ('suffixes', 'mime_types', 'magic_bytes')
+
+    # number of bytes passed to the quick_check of the readers
+    prefix_size = 4096
+
     def __init__(self):
         self._registry = {
             'readers': {},
+            'suffixes': {},
+            'mime_types': {},
+            'magic_bytes': {}
         }
+        self._readers = OrderedDict()
 
     def register(self, reader):
         if reader.identifier in self._registry['readers']:
@@ -33,17 +42,53 @@ class Readers:
                              .format(reader.identifier))
         self._registry['readers'][reader.identifier] = reader
 
+        # add the reader to the index for every suffix, mime type and magic bytes it declares
+        for key in self.index_keys:
+            for value in getattr(reader, key) or []:
+                if key == 'suffixes':
+                    value = value.lower()
+                self._registry[key].setdefault(value, set()).add(reader.identifier)
+
+        # sort the readers once here and not for every file
+        sorted_readers = sorted(self._registry['readers'].values(), key=lambda reader: reader.priority)
+        self._readers = OrderedDict([(reader.identifier, reader) for reader in sorted_readers])
+
     @property
     def readers(self):
-        sorted_readers = sorted(self._registry['readers'].values(), key=lambda reader: reader.priority)
-        return OrderedDict([(reader.identifier, reader) for reader in sorted_readers])
+        return self._readers
+
+    def get_candidates(self, file):
+        # collect the readers which declared a suffix, mime type or magic bytes, but
+        # not the ones of this file, readers without declarations are always candidates
+        excluded = set()
+        for key in self.index_keys:
+            index = self._registry[key]
+            if key == 'suffixes':
+                matched = index.get(file.suffix.lower(), set())
+            elif key == 'mime_types':
+                matched = index.get(file.mime_type, set())
+            else:
+                matched = set()
+                for magic_bytes, identifiers in index.items():
+                    if file.content[:len(magic_bytes)] == magic_bytes:
+                        matched |= identifiers
+
+            for identifiers in index.values():
+                excluded |= identifiers - matched
+
+        return [reader for identifier, reader in self.readers.items() if identifier not in excluded]
 
     def match_reader(self, file):
         logger.debug('file_name=%s content_type=%s mime_type=%s encoding=%s',
                      file.name, file.content_type, file.mime_type, file.encoding)
 
-        for identifier, reader in self.readers.items():
+        prefix = file.content[:self.prefix_size]
+
+        for reader in self.get_candidates(file):
             reader = reader(file)
+            if not reader.quick_check(prefix):
+                continue
+
             result = reader.check()
 
             # reset file pointer and return the reader it is the one
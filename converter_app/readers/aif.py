@@ -8,11 +8,20 @@ logger = logging.getLogger(__name__)
 class AifReader(AsciiReader):
     identifier = 'aif_reader'
     priority = 95
+    suffixes = ['.txt']
+    mime_types = ['text/plain']
+
+    def quick_check(self, prefix):
+        lines = self.peek_lines(prefix)
+        if lines is None:
+            return True
+
+        return bool(lines) and 'raw2aif' in lines[0]
 
     def check(self):
         result = False
         if self.file.suffix.lower() == '.txt' and self.file.mime_type == 'text/plain':
-            first_line = self.file.string.splitlines()[0]
+            first_line = self.file.lines[0]
             result = 'raw2aif' in first_line
 
         logger.debug('result=%s', result)
@@ -13,6 +13,8 @@ logger = logging.getLogger(__name__)
 class AscZipReader(Reader):
     identifier = 'asc_zip_reader'
     priority = 10
+    suffixes = ['.zip']
+    mime_types = ['application/zip']
     filedata = {}
     # two or more chars in row
 
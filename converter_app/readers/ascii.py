@@ -13,6 +13,9 @@ class AsciiReader(Reader):
     # two or more chars in row
     text_pattern = re.compile(r'[A-Za-z]{2,}')
 
+    def quick_check(self, prefix):
+        return self.file.encoding != 'binary'
+
     def check(self):
         if self.file.encoding == 'binary':
             result = False
@@ -46,7 +49,6 @@ class AsciiReader(Reader):
                 row = row.replace('n.a.', '')
                 float_match = self.float_pattern.findall(row)
                 if float_match:
-                    float_match = [self.get_value(float_str) for float_str in float_match]
                     count = len(float_match)
 
                     if table['rows'] and count != previous_count:
@@ -65,6 +67,7 @@ class AsciiReader(Reader):
 
         # loop over tables and append columns
         for table in tables:
+            table['rows'] = self.get_rows(table['rows'])
             if table['rows']:
                 table['columns'] = [{
                     'key': str(idx),
@@ -1,6 +1,9 @@
 import logging
 import re
 from datetime import datetime
+from operator import itemgetter
+
+from ..models import Table
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +14,19 @@ class Reader(object):
     float_de_pattern = re.compile(r'(-?[\d.]+,\d*[eE+\-\d]*)')
     float_us_pattern = re.compile(r'(-?[\d,]+.\d*[eE+\-\d]*)')
 
+    # null byte separated strings, which all either start like float_de_pattern,
+    # or have neither a comma nor a period, and are therefore changed the same way
+    float_de_values_pattern = re.compile(r'(?:-?[\d.]+,[^\x00]*|[^\x00,.]*)(?:\x00(?:-?[\d.]+,[^\x00]*|[^\x00,.]*))*')
+
+    # the number of strings which are checked before all strings of a column are checked
+    values_sample_size = 10
+
+    # the suffixes, mime types and leading bytes this reader accepts, they are used
+    # by the registry to skip readers early, None means that every file is accepted
+    suffixes = None
+    mime_types = None
+    magic_bytes = None
+
     def __init__(self, file):
         self.file = file
 
@@ -21,6 +37,11 @@ class Reader(object):
             'metadata': self.metadata
         }
 
+    def quick_check(self, prefix):
+        # a cheap check, which only sees the first bytes of the file, check()
+        # is only called for readers which return True here
+        return True
+
     def check(self):
         raise NotImplementedError
 
@@ -28,6 +49,10 @@ class Reader(object):
         self.tables = self.get_tables()
         self.metadata = self.get_metadata()
 
+        # store the rows of the tables column by column
+        for table in self.tables:
+            table.pack()
+
     def validate(self):
         for table_index, table in enumerate(self.tables):
             for key, value in table['metadata'].items():
@@ -53,13 +78,23 @@ class Reader(object):
             'uploaded': datetime.utcnow().isoformat()
         }
 
+    def peek_lines(self, prefix, count=1):
+        # return the first lines of the prefix, or None if the prefix does not
+        # contain them completely and the full check needs to decide
+        if self.file.encoding == 'binary':
+            return []
+
+        lines = prefix.decode(self.file.encoding, errors='ignore').splitlines()
+        if len(prefix) < len(self.file.content):
+            # the last line could be cut off
+            lines = lines[:-1]
+            if len(lines) < count:
+                return None
+
+        return lines[:count]
+
     def append_table(self, tables):
-        table = {
-            'header': [],
-            'metadata': {},
-            'columns': [],
-            'rows': []
-        }
+        table = Table()
         tables.append(table)
         return table
 
@@ -76,6 +111,35 @@ class Reader(object):
 
         return shape
 
+    def get_rows(self, rows):
+        # apply get_value to the cells of the rows, column by column
+        if not rows:
+            return rows
+
+        length = len(rows[0])
+        if any(len(row) != length for row in rows):
+            return [self.get_values(row) for row in rows]
+
+        columns = [self.get_values(list(map(itemgetter(index), rows))) for index in range(length)]
+        if columns:
+            return list(map(list, zip(*columns)))
+        else:
+            return [[] for row in rows]
+
+    def get_values(self, values):
+        # apply get_value to a list of strings, the convention is checked for all strings at once:
+        # without any comma nothing changes, if all strings use a decimal comma they are changed in
+        # one go, and only for mixed strings (already in the sample) get_value is called for each string
+        string = '\x00'.join(values)
+        if values and string.count('\x00') == len(values) - 1:
+            if ',' not in string:
+                return list(values)
+            elif all(map(self.float_de_values_pattern.fullmatch, values[:self.values_sample_size])) and \
+                    self.float_de_values_pattern.fullmatch(string):
+                return string.replace('.', '').replace(',', '.').split('\x00')
+
+        return [self.get_value(value) for value in values]
+
     def get_value(self, value):
         if self.float_de_pattern.match(value):
             # remove any digit group seperators and replace the comma with a period
@@ -11,6 +11,7 @@ logger = logging.getLogger(__name__)
 class BrmlReader(Reader):
     identifier = 'brml_reader'
     priority = 10
+    suffixes = ['.brml']
 
     def check(self):
         if self.file.suffix != '.brml':
@@ -36,8 +36,9 @@ class CaryReader(CSVReader):
     # X Mode  Nanometers
 
     def check(self):
-        # check using seperate function in the CSVReader
-        result = self.check_csv()
+        # check using seperate function in the CSVReader, and look for the
+        # instrument before the file is split
+        result = self.check_csv() and 'Instrument  Cary' in self.file.string
         if result:
             # split the file at the first empty line
             split = re.split(r'(?:\r?\n){2,}', self.file.string.strip())
@@ -10,6 +10,8 @@ logger = logging.getLogger(__name__)
 class CifReader(Reader):
     identifier = 'cif_reader'
     priority = 95
+    suffixes = ['.cif']
+    mime_types = ['text/plain']
     cif = None
 
     junk_size_threshold = 500
@@ -36,7 +38,7 @@ class CifReader(Reader):
         result = self.file.suffix.lower() == '.cif' and self.file.mime_type == 'text/plain'
         if result:
             try:
-                self.cif = cif.read_string(self.file.content)  # copy all the data from mmCIF file
+                self.cif = cif.read_string(bytes(self.file.content))  # copy all the data from mmCIF file
             except:
                 result = False
 
@@ -1,12 +1,25 @@
 import csv
-import io
+import itertools
 import logging
+import re
 
 from .base import Reader
 
 logger = logging.getLogger(__name__)
 
 
+class SniffedDialect(csv.Dialect):
+    lineterminator = '\r\n'
+    quoting = csv.QUOTE_MINIMAL
+
+    def __init__(self, delimiter, quotechar, doublequote, skipinitialspace):
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.doublequote = doublequote
+        self.skipinitialspace = skipinitialspace
+        super().__init__()
+
+
 class CSVReader(Reader):
     identifier = 'csv_reader'
     priority = 100
@@ -25,47 +38,142 @@ class CSVReader(Reader):
     }
     sniff_buffer_size = 100000
 
+    # matches the cells of a row joined by null bytes, if every cell starts with a
+    # float (see Reader.float_pattern) and is therefore neither a string nor empty
+    float_row_pattern = re.compile(r'\s*-?\d[^\x00]*(?:\x00\s*-?\d[^\x00]*)*')
+    sniff_chunk_size = 10
+    sniff_consistency = 0.91
+
+    # the patterns for quoted fields, which are also used by csv.Sniffer
+    quote_patterns = [re.compile(pattern, re.DOTALL | re.MULTILINE) for pattern in [
+        r'(?P<delim>[^\w\n"\'])(?P<space> ?)(?P<quote>["\']).*?(?P=quote)(?P=delim)',
+        r'(?:^|\n)(?P<quote>["\']).*?(?P=quote)(?P<delim>[^\w\n"\'])(?P<space> ?)',
+        r'(?P<delim>[^\w\n"\'])(?P<space> ?)(?P<quote>["\']).*?(?P=quote)(?:$|\n)',
+        r'(?:^|\n)(?P<quote>["\']).*?(?P=quote)(?:$|\n)'
+    ]]
+
+    def quick_check(self, prefix):
+        return self.file.encoding != 'binary'
+
     def check(self):
         # check using seperate function for inheritance
         result = self.check_csv()
         if result:
-            self.rows = list(csv.reader(io.StringIO(self.file.string), self.file.csv_dialect))
-            self.lines = self.file.string.splitlines()
+            self.rows = self.file.csv_rows
+            self.lines = self.file.lines
 
         logger.debug('result=%s', result)
         return result
 
     def check_csv(self):
         try:
-            # check if the csv dialect was already found
-            self.file.csv_dialect
-            return True
+            # check if the csv dialect was already sniffed, the result is stored
+            # in the file (even if no dialect was found) for all csv based readers
+            return self.file.csv_dialect is not None
         except AttributeError:
-            if self.file.string is not None:
-                # check different delimiters one by one
-                for delimiter in self.delimiters.keys():
-                    try:
-                        self.file.csv_dialect = csv.Sniffer().sniff(self.file.string[:self.sniff_buffer_size], delimiters=delimiter)
-                        return True
-                    except csv.Error:
-                        pass
+            self.file.csv_dialect, self.file.csv_confidence = self.sniff_dialect()
+            logger.debug('csv_confidence=%s', self.file.csv_confidence)
+            return self.file.csv_dialect is not None
+
+    def sniff_dialect(self):
+        # the sample is scanned only once for all delimiters, the result is the same as for
+        # csv.Sniffer().sniff(sample, delimiters=delimiter), tried for one delimiter after another,
+        # the confidence is the consistency of the number of delimiters in the lines of the sample
+        if self.file.string is None:
+            return None, 0.0
+
+        sample = self.file.string[:self.sniff_buffer_size]
+        lines = [line for line in sample.split('\n') if line]
+        quotes = self.sniff_quotes(sample)
+
+        for delimiter in self.delimiters.keys():
+            consistency = self.get_consistency([line.count(delimiter) for line in lines])
+
+            if quotes:
+                quotechar, delimiter_counts, spaces = quotes
+                if delimiter in delimiter_counts:
+                    doublequote = self.sniff_doublequote(sample, quotechar, delimiter)
+                    skipinitialspace = delimiter_counts[delimiter] == spaces
+                    return SniffedDialect(delimiter, quotechar, doublequote, skipinitialspace), max(consistency, 0.0)
+                else:
+                    doublequote = self.sniff_doublequote(sample, quotechar, '')
+            else:
+                quotechar, doublequote = '"', False
 
-        return False
+            if consistency >= self.sniff_consistency:
+                skipinitialspace = lines[0].count(delimiter) == lines[0].count(delimiter + ' ')
+                return SniffedDialect(delimiter, quotechar, doublequote, skipinitialspace), consistency
+
+        return None, 0.0
+
+    def sniff_quotes(self, sample):
+        # look for quoted fields, which are preceded or followed by a delimiter
+        for pattern in self.quote_patterns:
+            matches = list(pattern.finditer(sample))
+            if matches:
+                break
+        else:
+            return None
+
+        quotes = {}
+        delimiter_counts = {}
+        spaces = 0
+        for match in matches:
+            groups = match.groupdict()
+            quotes[groups['quote']] = quotes.get(groups['quote'], 0) + 1
+
+            if 'delim' in groups:
+                delimiter = groups['delim']
+                delimiter_counts[delimiter] = delimiter_counts.get(delimiter, 0) + 1
+                if groups['space']:
+                    spaces += 1
+
+        return max(quotes, key=quotes.get), delimiter_counts, spaces
+
+    def sniff_doublequote(self, sample, quotechar, delimiter):
+        # look for an extra quote between delimiters
+        pattern = r'(({delim})|^)\W*{quote}[^{delim}\n]*{quote}[^{delim}\n]*{quote}\W*(({delim})|$)'.format(
+            delim=re.escape(delimiter), quote=quotechar
+        )
+        return re.search(pattern, sample, re.MULTILINE) is not None
+
+    def get_consistency(self, counts):
+        # the lines are evaluated in chunks, until the most frequent count (if it is not 0)
+        # is consistent across the lines so far, the consistency is the number of lines with
+        # the most frequent count minus the number of all other lines, divided by the number of lines
+        frequencies = {}
+        consistency = 0.0
+        for start in range(0, len(counts), self.sniff_chunk_size):
+            for count in counts[start:start + self.sniff_chunk_size]:
+                frequencies[count] = frequencies.get(count, 0) + 1
+
+            total = min(start + self.sniff_chunk_size, len(counts))
+            count, frequency = max(frequencies.items(), key=lambda item: item[1])
+            if count > 0:
+                consistency = (2 * frequency - total) / total
+                if consistency >= self.sniff_consistency:
+                    break
+
+        return consistency
 
     def get_tables(self):
         tables = []
         table = self.append_table(tables)
 
-        # loop over rows and sort into blocks of similar shape
+        # loop over runs of rows with the same shape and sort them into blocks of similar
+        # shape, the indexes of a block are a range, since the blocks are contiguous
         blocks = []
         block = {}
-        for index, row in enumerate(self.rows):
-            shape = self.get_shape(row)
+        start = 0
+        for shape, run in itertools.groupby(self.get_shapes(self.rows)):
+            stop = start + sum(1 for _ in run)
             if block.get('shape') is None or not self.compare_shape(shape, block.get('shape', [])):
-                block = {'indexes': [], 'shape': shape}
+                block = {'indexes': range(start, stop), 'shape': shape}
                 blocks.append(block)
+            else:
+                block['indexes'] = range(block['indexes'].start, stop)
 
-            block['indexes'].append(index)
+            start = stop
 
         # loop over blocks and sort into header, table, and metadata
         prev_block = None
@@ -93,12 +201,13 @@ class CSVReader(Reader):
                             # remove the colum line from the header
                             table['header'] = table['header'][:-1]
 
-                table['rows'] += [[self.get_value(value) for value in self.rows[index]] for index in block['indexes']]
+                table['rows'] += [self.rows[index] for index in block['indexes']]
 
             prev_block = block
 
         # build columns
         for table in tables:
+            table['rows'] = self.get_rows(table['rows'])
             table['columns'] = []
             if table['rows']:
                 for idx in range(len(table['rows'][0])):
@@ -123,6 +232,18 @@ class CSVReader(Reader):
         metadata['skipinitialspace'] = str(self.file.csv_dialect.skipinitialspace)
         return metadata
 
+    def get_shapes(self, rows):
+        # rows which contain only floats are classified with one match for the whole
+        # row and share the same shape, all other rows are classified cell by cell
+        float_shapes = {}
+        for row in rows:
+            if self.float_row_pattern.fullmatch('\x00'.join(row)):
+                if len(row) not in float_shapes:
+                    float_shapes[len(row)] = ['f'] * len(row)
+                yield float_shapes[len(row)]
+            else:
+                yield self.get_shape(row)
+
     def get_shape(self, row):
         shape = []
         for cell in row:
@@ -8,11 +8,20 @@ logger = logging.getLogger(__name__)
 class DSPReader(Reader):
     identifier = 'dsp_reader'
     priority = 95
+    suffixes = ['.dsp']
+    mime_types = ['text/plain']
+
+    def quick_check(self, prefix):
+        lines = self.peek_lines(prefix)
+        if lines is None:
+            return True
+
+        return bool(lines) and 'sinacsa' in lines[0]
 
     def check(self):
         result = False
         if self.file.suffix.lower() == '.dsp' and self.file.mime_type == 'text/plain':
-            first_line = self.file.string.splitlines()[0]
+            first_line = self.file.lines[0]
             result = 'sinacsa' in first_line
 
         logger.debug('result=%s', result)
@@ -29,12 +38,13 @@ class DSPReader(Reader):
             if header:
                 table['header'].append(row)
             elif row:
-                table['rows'].append([self.get_value(row)])
+                table['rows'].append([row])
 
             if row == '#DATA':
                 # this is where the data starts
                 header = False
 
+        table['rows'] = self.get_rows(table['rows'])
         if table['rows']:
             table['columns'] = [{
                 'key': str(idx),
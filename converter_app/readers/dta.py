@@ -8,6 +8,8 @@ logger = logging.getLogger(__name__)
 class DtaReader(Reader):
     identifier = 'dta_reader'
     priority = 10
+    suffixes = ['.dta']
+    mime_types = ['text/plain']
 
     def check(self):
         if self.file.encoding == 'binary':
@@ -69,7 +71,7 @@ class DtaReader(Reader):
 
                 else:
                     # now we extract the actual table
-                    table['rows'].append([self.get_value(value) for value in row.split()])
+                    table['rows'].append(row.split())
 
             # check if this is the last line of the header
             if row.startswith('CURVE'):
@@ -78,4 +80,7 @@ class DtaReader(Reader):
             table['metadata']['rows'] = str(len(table['rows']))
             table['metadata']['columns'] = str(len(table['columns']))
 
+        for table in tables:
+            table['rows'] = self.get_rows(table['rows'])
+
         return tables
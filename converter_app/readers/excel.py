@@ -11,6 +11,7 @@ logger = logging.getLogger(__name__)
 class ExcelReader(Reader):
     identifier = 'excel_reader'
     priority = 15
+    suffixes = ['.xlsx']
 
     def check(self):
         if self.file.encoding != 'binary':
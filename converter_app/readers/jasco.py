@@ -10,10 +10,18 @@ class JascoReader(Reader):
     priority = 99
     header_length = 8
 
+    def quick_check(self, prefix):
+        lines = self.peek_lines(prefix, 2)
+        if lines is None:
+            return True
+
+        # the file has to consist of a single line
+        return len(lines) == 1
+
     def check(self):
         result = False
         if self.file.string is not None:
-            if len(self.file.string.splitlines()) == 1:
+            if len(self.file.lines) == 1:
                 file_lines = self.file.string.split(',')
                 if file_lines[self.header_length - 1] == str(len(file_lines) - self.header_length):
                     result = True
@@ -32,10 +40,11 @@ class JascoReader(Reader):
                 table['header'].append(line)
             else:
                 x, y = line.split()
-                table['rows'].append((self.get_value(x), self.get_value(y)))
+                table['rows'].append((x, y))
 
         # build columns
         for table in tables:
+            table['rows'] = self.get_rows(table['rows'])
             table['columns'] = []
             if table['rows']:
                 for idx in range(len(table['rows'][0])):
@@ -5,6 +5,7 @@ import logging
 import re
 import sys
 
+from ..models import Table
 from .csv import CSVReader
 
 logger = logging.getLogger(__name__)
@@ -19,15 +20,23 @@ class NovaReader(CSVReader):
     first_row = ['Potential applied (V)', 'Time (s)', 'WE(1).Current (A)', 'WE(1).Potential (V)', 'Scan', 'Index', 'Q+', 'Q-']
     scan_index = 4
 
+    def quick_check(self, prefix):
+        lines = self.peek_lines(prefix)
+        if lines is None:
+            return True
+
+        # the first column name has to be in the first line, regardless of the dialect
+        return bool(lines) and self.first_row[0] in lines[0]
+
     def check(self):
         # check using seperate function in the CSVReader
         result = self.check_csv()
         if result:
-            first_line = self.file.string.splitlines()[0]
+            first_line = self.file.lines[0]
             first_row = next(csv.reader(io.StringIO(first_line), self.file.csv_dialect))
             if first_row[:8] == self.first_row:
-                self.rows = list(csv.reader(io.StringIO(self.file.string), self.file.csv_dialect))
-                self.lines = self.file.string.splitlines()
+                self.rows = self.file.csv_rows
+                self.lines = self.file.lines
             else:
                 result = False
 
@@ -49,12 +58,9 @@ class NovaReader(CSVReader):
             for row in csv_table['rows']:
                 if row[self.scan_index] != scan:
                     scan = row[self.scan_index]
-                    table = {
-                        'header': [],
-                        'metadata': copy.deepcopy(csv_table.get('metadata', {})),
-                        'columns': copy.deepcopy(csv_table.get('columns', {})),
-                        'rows': []
-                    }
+                    table = Table()
+                    table['metadata'] = copy.deepcopy(csv_table.get('metadata', {}))
+                    table['columns'] = copy.deepcopy(csv_table.get('columns', {}))
 
                     # add the units of some of the colums as metadata
                     for key in list(table['metadata'].keys()):
@@ -9,6 +9,7 @@ logger = logging.getLogger(__name__)
 class PsSessionReader(Reader):
     identifier = 'pssession_reader'
     priority = 10
+    suffixes = ['.pssession']
 
     def check(self):
         if self.file.suffix != '.pssession':
@@ -21,7 +22,7 @@ class PsSessionReader(Reader):
 
     def parse_json(self):
         try:
-            return json.loads(self.file.content.strip(b'\xfe\xff'))
+            return json.loads(bytes(self.file.content).strip(b'\xfe\xff'))
         except json.decoder.JSONDecodeError:
             return {}
 
@@ -11,21 +11,36 @@ UNIT_EXTENSION = "_unit"
 class SecReader(Reader):
     identifier = 'sec_reader'
     priority = 95
+    suffixes = ['.txt']
+    mime_types = ['text/plain']
 
     _has_header = False
     _has_first_value = False
     _is_table_empty = True
     _is_calibration = 0
 
+    def quick_check(self, prefix):
+        lines = self.peek_lines(prefix, 3)
+        if lines is None:
+            return True
+
+        return self.check_lines(lines)
+
     def check(self):
         result = False
         if self.file.suffix.lower() == '.txt' and self.file.mime_type == 'text/plain':
-            first_lines = [self.file.string.splitlines()[0], self.file.string.splitlines()[1], self.file.string.splitlines()[2]]
-            result = 'Sample :' in first_lines[0] and 'Method settings :' in first_lines[1] and 'Sequence table :' in first_lines[2]
+            first_lines = self.file.lines[:3]
+            result = self.check_lines(first_lines)
 
         logger.debug('result=%s', result)
         return result
 
+    def check_lines(self, first_lines):
+        return len(first_lines) == 3 and \
+            'Sample :' in first_lines[0] and \
+            'Method settings :' in first_lines[1] and \
+            'Sequence table :' in first_lines[2]
+
     def _append_table(self, tables):
         self._has_header = False
         self._has_first_value = False
@@ -90,11 +105,9 @@ class SecReader(Reader):
                         })
                     self._has_header = True
                 else:
-                    for col_idx in range(len(table['columns'])):
-                        if col_idx < len(line_array):
-                            line_array[col_idx] = self.get_value(line_array[col_idx].replace(' ', ''))
-                        else:
-                            line_array.append('')
+                    count = len(table['columns'])
+                    line_array[:count] = self.get_values([value.replace(' ', '') for value in line_array[:count]])
+                    line_array += [''] * (count - len(line_array))
 
                     self._has_first_value = True
                     table['rows'].append(line_array)
@@ -9,10 +9,17 @@ class SemReader(AsciiReader):
     identifier = 'sem_reader'
     priority = 95
 
+    def quick_check(self, prefix):
+        lines = self.peek_lines(prefix)
+        if lines is None:
+            return True
+
+        return bool(lines) and lines[0].startswith('$SEM_DATA_VERSION')
+
     def check(self):
         result = False
         if super(SemReader, self).check():
-            first_line = self.file.string.splitlines()[0]
+            first_line = self.file.lines[0]
             result = first_line.startswith('$SEM_DATA_VERSION')
 
         logger.debug('result=%s', result)
@@ -33,8 +40,7 @@ class SemReader(AsciiReader):
                     table['metadata']['columns'] = str(len(table['columns']))
                     table = self.append_table(tables)
                 else:
-                    float_match = [self.get_value(float_str) for float_str in row_array]
-                    table['rows'].append(float_match)
+                    table['rows'].append(row_array)
             if not table_mode:
                 if len(row_array) > 1 and all([x.startswith("$") for x in row_array]):
                     table_mode = True
@@ -52,5 +58,9 @@ class SemReader(AsciiReader):
 
         table['metadata']['rows'] = str(len(table['rows']))
         table['metadata']['columns'] = str(len(table['columns']))
+
+        for table in tables:
+            table['rows'] = self.get_rows(table['rows'])
+
         return tables
 
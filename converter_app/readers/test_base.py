@@ -0,0 +1,28 @@
+import random
+
+from .base import Reader
+
+
+def test_get_values_random():
+    rng = random.Random(19)
+    reader = Reader(None)
+    values = ['1,5', '1.234,5', '-2,0', '3', '1.5', '1,234.5', 'abc', '', '1e5', '2,5e-3', ' 1,2', 'a,b',
+              '.5', ',5', '1.', '1,', '-', '1\x002']
+
+    for _ in range(5000):
+        cells = [rng.choice(values) for _ in range(rng.randint(0, 25))]
+        assert reader.get_values(cells) == [reader.get_value(cell) for cell in cells], cells
+
+
+def test_get_rows_random():
+    rng = random.Random(19)
+    reader = Reader(None)
+    values = ['1,5', '1.234,5', '3', '1.5', '1,234.5', 'abc', '']
+
+    for _ in range(1000):
+        columns = rng.randint(0, 4)
+        rows = [
+            [rng.choice(values) for _ in range(columns if rng.random() < 0.9 else rng.randint(0, 4))]
+            for _ in range(rng.randint(0, 20))
+        ]
+        assert reader.get_rows(rows) == [[reader.get_value(cell) for cell in row] for row in rows], rows
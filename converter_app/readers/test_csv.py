@@ -0,0 +1,162 @@
+import csv
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from .csv import CSVReader
+
+
+def sniff_dialect_sniffer(string):
+    # the previous implementation of CSVReader.sniff_dialect
+    for delimiter in CSVReader.delimiters.keys():
+        try:
+            return csv.Sniffer().sniff(string[:CSVReader.sniff_buffer_size], delimiters=delimiter)
+        except csv.Error:
+            pass
+
+
+def get_attributes(dialect):
+    if dialect is not None:
+        return (dialect.delimiter, dialect.quotechar, bool(dialect.doublequote),
+                bool(dialect.skipinitialspace), dialect.lineterminator, dialect.quoting)
+
+
+def sniff_dialect(string):
+    reader = CSVReader(SimpleNamespace(string=string, encoding='utf-8'))
+    return reader.sniff_dialect()
+
+
+@pytest.mark.parametrize('string', [
+    '',
+    'a',
+    '1,2,3\n4,5,6\n7,8,9\n',
+    '1;2;3\n4;5;6\n',
+    '1\t2\t3\n4\t5\t6\r\n',
+    'x y\n1, 2, 3\n4, 5, 6\n',
+    '"a","b"\n"c","d"\n',
+    "'a';'b'\n'c';'d'\n",
+    '"a ""b""",1\n"c",2\n',
+    'time;value\n0,1;2,5\n0,2;2,6\n'
+])
+def test_sniff_dialect(string):
+    dialect, confidence = sniff_dialect(string)
+    assert get_attributes(dialect) == get_attributes(sniff_dialect_sniffer(string))
+    assert 0.0 <= confidence <= 1.0
+
+
+def test_sniff_dialect_random():
+    rng = random.Random(6)
+    characters = ['a', 'b', '1', '2', '.', ',', ';', '\t', ' ', '"', "'", '\n', '-', 'x', '""', '\r\n']
+    cells = ['1', '2.5', '"a b"', "'x'", '', ' 3', '"q""q"']
+
+    for _ in range(2000):
+        string = ''.join(rng.choice(characters) for _ in range(rng.randint(0, 200)))
+        if rng.random() < 0.5:
+            delimiter = rng.choice(list(CSVReader.delimiters.keys()))
+            lines = [
+                delimiter.join(rng.choice(cells) for _ in range(rng.randint(1, 4)))
+                for _ in range(rng.randint(1, 30))
+            ]
+            string = '\n'.join(lines) + rng.choice(['', '\n', string])
+
+        dialect, _ = sniff_dialect(string)
+        assert get_attributes(dialect) == get_attributes(sniff_dialect_sniffer(string)), repr(string)
+
+
+class RowByRowCSVReader(CSVReader):
+    # the previous implementation of CSVReader.get_tables, which classifies and converts the rows one by one
+
+    def get_tables(self):
+        tables = []
+        table = self.append_table(tables)
+
+        # loop over rows and sort into blocks of similar shape
+        blocks = []
+        block = {}
+        for index, row in enumerate(self.rows):
+            shape = self.get_shape(row)
+            if block.get('shape') is None or not self.compare_shape(shape, block.get('shape', [])):
+                block = {'indexes': [], 'shape': shape}
+                blocks.append(block)
+
+            block['indexes'].append(index)
+
+        # loop over blocks and sort into header, table, and metadata
+        prev_block = None
+        for block in blocks:
+            if len(block['indexes']) < self.table_min_rows or not block['shape']:
+                # this is the header
+                if table['rows']:
+                    # if a table is already there, this must be a new header
+                    table = self.append_table(tables)
+
+                table['header'] += [self.lines[index] for index in block['indexes']]
+            else:
+                # this is the table
+                if not table['rows']:
+                    # if there are no tables, we can try to find the columns previous line
+                    if prev_block:
+                        this_row = self.rows[block['indexes'][0]]
+                        prev_row = self.rows[prev_block['indexes'][-1]]
+
+                        if len(prev_row) > 0 and len(prev_row) <= len(this_row):
+                            # add the column names as metadata
+                            table['metadata'] = {
+                                'column_{:02d}'.format(idx): str(value) for idx, value in enumerate(prev_row)
+                            }
+                            # remove the colum line from the header
+                            table['header'] = table['header'][:-1]
+
+                table['rows'] += [[self.get_value(value) for value in self.rows[index]] for index in block['indexes']]
+
+            prev_block = block
+
+        # build columns
+        for table in tables:
+            table['columns'] = []
+            if table['rows']:
+                for idx in range(len(table['rows'][0])):
+                    name = table['metadata'].get('column_{:02d}'.format(idx))
+                    table['columns'].append({
+                        'key': str(idx),
+                        'name': 'Column #{} ({})'.format(idx, name) if name else 'Column #{}'.format(idx)
+                    })
+
+            table['metadata']['rows'] = str(len(table['rows']))
+            table['metadata']['columns'] = str(len(table['columns']))
+
+        return tables
+
+
+def get_tables(reader_class, rows):
+    reader = reader_class(None)
+    reader.rows = rows
+    reader.lines = ['\t'.join(row) for row in rows]
+    return [dict(table, rows=[list(row) for row in table['rows']]) for table in reader.get_tables()]
+
+
+def test_get_shapes_random():
+    rng = random.Random(7)
+    reader = CSVReader(None)
+    cells = ['1', ' -2.5', 'a', '', 'n.a.', '  ', '1a', '-', '-x', '\t3', '\xe9', '1\x002', '\x001']
+
+    for _ in range(5000):
+        row = [rng.choice(cells) for _ in range(rng.randint(0, 5))]
+        assert next(reader.get_shapes([row])) == reader.get_shape(row), repr(row)
+
+
+def test_get_tables_random():
+    rng = random.Random(7)
+    cells = ['1', '-2.5', '1,5', '1.234,5', '3e-4', 'n.a.', '', 'abc', 'x y']
+
+    for _ in range(300):
+        rows = []
+        for _ in range(rng.randint(1, 4)):
+            rows += [[rng.choice(cells[5:])] for _ in range(rng.randint(0, 4))]
+
+            columns = rng.randint(1, 4)
+            for _ in range(rng.randint(1, 40)):
+                rows.append([rng.choice(cells) if rng.random() < 0.1 else rng.choice(cells[:5]) for _ in range(columns)])
+
+        assert get_tables(CSVReader, rows) == get_tables(RowByRowCSVReader, rows)
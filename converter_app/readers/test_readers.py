@@ -0,0 +1,211 @@
+import csv
+import io
+import json
+import random
+import zipfile
+
+import openpyxl
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from ..app import create_app
+from ..models import File
+from . import registry
+from .csv import CSVReader
+
+
+@pytest.fixture
+def app():
+    return create_app()
+
+
+def get_zip(files, prefix=b''):
+    buffer = io.BytesIO()
+    buffer.write(prefix)
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for file_name, string in files.items():
+            zf.writestr(file_name, string)
+    return buffer.getvalue()
+
+
+def get_xlsx(rng):
+    workbook = openpyxl.Workbook()
+    workbook.active.append(['x', 'y'])
+    for index in range(20):
+        workbook.active.append([index, rng.random()])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def get_samples():
+    # small files for all readers, and files which should not match them
+    rng = random.Random(1)
+
+    def get_lines(line_format, count, separator='\n'):
+        return separator.join(line_format.format(index, rng.random()) for index in range(count)) + separator
+
+    xlsx = get_xlsx(rng)
+    pssession = {'type': 'PSSession', 'measurements': [{
+        'method': '#comment\nkey=value', 'title': 'CV', 'timestamp': 1, 'deviceused': 5, 'deviceserial': 'X',
+        'dataset': {'type': 'ds', 'values': [
+            {'description': 'potential', 'datavalues': [{'v': index * 0.1} for index in range(20)]},
+            {'description': 'current', 'datavalues': [{'v': rng.random()} for _ in range(20)]}
+        ]}
+    }]}
+
+    return [
+        ('comma.csv', 'Title: test\nDate,2021-01-01\n\nx,y\n' + get_lines('{},{:.4f}', 40)),
+        ('german.csv', 'Messung;Probe A\r\n' + get_lines('{};{:.3f}', 30, '\r\n').replace('.', ',')),
+        ('tabs.tsv', 'name\tvalue\n' + get_lines('{}\t{:.2e}', 25)),
+        ('nova.csv', 'Potential applied (V);Time (s);WE(1).Current (A);WE(1).Potential (V);Scan;Index;Q+;Q-\n' +
+         get_lines('0,{0};{0},1;{1:.6e};0,0;1;{0};1,0;2,0', 30).replace('.', ',')),
+        ('cary.csv', 'Sample1,\nWavelength (nm),Abs\n' + get_lines('{}.0,{:.5f}', 30) +
+         '\n\nCollection Time: 6/17/2021\nInstrument  Cary 60\nX Mode  Nanometers\n'),
+        ('jasco.txt', 'J,A,S,C,O,x,y,5,' + ','.join('{} {:.3f}'.format(index, rng.random()) for index in range(5))),
+        ('data.xy', 'Some Header Text\n' + get_lines('{}.5   {:.4f}   n.a.', 30)),
+        ('test.DTA', 'EXPLAIN\nTAG\tCV\nCURVE\tTABLE\n\tPt\tT\tVf\n' + get_lines('\t{}\t0.1\t{:.5E}', 20)),
+        ('sem.txt', '$SEM_DATA_VERSION 1\n$CM_MAG 1000\n$A $B\n' + get_lines('{} {:.2f}', 10)),
+        ('iso.txt', "# raw2aif converted\n_units_temperature K\nloop_\n_adsorp_pressure\n_adsorp_amount\n" +
+         get_lines('{} {:.4f}', 20)),
+        ('spec.dsp', 'sinacsa dsp file\nparam 1\n#DATA\n' + get_lines('{:.0f}{:.3f}', 30)),
+        ('sec.txt', 'Sample : \tS1\nMethod settings : \tM1\nSequence table : \tT1\n\nVolume\tSignal\n' +
+         get_lines('{}\t{:.3f}', 10)),
+        ('other.txt', 'Sample : \tS1\nnothing else\n'),
+        ('x.cif', 'data_test\n_cell_length_a 5.0\nloop_\n_atom_site_label\n_atom_site_fract_x\nC1 0.1\nC2 0.2\n'),
+        ('x.dsp', 'not a dsp file\n1\n2\n'),
+        ('test.pssession', json.dumps(pssession).encode('utf-16')),
+        ('xrd.brml', get_zip({'Experiment0/DataContainer.xml': '<DataContainer/>'})),
+        ('book.xlsx', xlsx),
+        ('BOOK.XLSX', xlsx),
+        ('book.xls', xlsx),
+        ('prefixed.xlsx', b'prefix' + xlsx),
+        ('data.zip', get_zip({'a.asc': '1 2\n3 4\n'})),
+        ('other.zip', get_zip({'a.txt': 'a'})),
+        ('rand.bin', bytes(rng.getrandbits(8) for _ in range(3000))),
+        ('empty.txt', b'')
+    ]
+
+
+samples = get_samples()
+sample_names = [file_name for file_name, _ in samples]
+
+
+def get_file(app, file_name, content):
+    if isinstance(content, str):
+        content = content.encode()
+
+    with app.app_context():
+        return File(FileStorage(io.BytesIO(content), file_name))
+
+
+def match_reader_all(file):
+    # the previous Readers.match_reader, which calls check() for all readers
+    for reader in registry.readers.values():
+        reader = reader(file)
+        result = reader.check()
+        file.fp.seek(0)
+        if result:
+            return reader
+
+
+def get_identifier(reader):
+    return None if reader is None else reader.identifier
+
+
+@pytest.mark.parametrize('file_name,content', samples, ids=sample_names)
+def test_match_reader(app, file_name, content):
+    # the index and the quick checks only skip readers, the matched reader is the same
+    reader = registry.match_reader(get_file(app, file_name, content))
+    assert get_identifier(reader) == get_identifier(match_reader_all(get_file(app, file_name, content)))
+
+
+@pytest.mark.parametrize('file_name,content', samples, ids=sample_names)
+def test_get_candidates(app, file_name, content):
+    # the readers, which are skipped by the index, would all reject the file in check()
+    candidates = registry.get_candidates(get_file(app, file_name, content))
+    for reader in registry.readers.values():
+        if reader not in candidates:
+            assert not reader(get_file(app, file_name, content)).check(), reader.identifier
+
+
+def test_get_candidates_index(app):
+    candidates = registry.get_candidates(get_file(app, 'book.xlsx', get_xlsx(random.Random(1))))
+    identifiers = [reader.identifier for reader in candidates]
+    assert 'excel_reader' in identifiers
+    assert 'dsp_reader' not in identifiers
+
+    # readers without declarations are candidates for every file
+    candidates = registry.get_candidates(get_file(app, 'test.unknown', 'a\n'))
+    assert all(reader.suffixes is None for reader in candidates)
+    assert [reader for reader in registry.readers.values() if reader.suffixes is None] == candidates
+
+
+@pytest.mark.parametrize('file_name,content', samples, ids=sample_names)
+@pytest.mark.parametrize('prefix_size', [0, 1, 10, 40, registry.prefix_size])
+def test_quick_check(app, file_name, content, prefix_size):
+    # a reader, which is rejected by quick_check for any prefix, would reject the file in check()
+    file = get_file(app, file_name, content)
+    prefix = file.content[:prefix_size]
+    for reader in registry.readers.values():
+        if not reader(file).quick_check(prefix):
+            assert not reader(get_file(app, file_name, content)).check(), reader.identifier
+
+
+def test_quick_check_prefix(app):
+    file = get_file(app, 'comma.csv', 'x,y\n1,2\n3,4\n')
+    rejected = [reader.identifier for reader in registry.readers.values()
+                if not reader(file).quick_check(file.content[:registry.prefix_size])]
+    assert sorted(rejected) == ['aif_reader', 'dsp_reader', 'jasco_reader', 'nova_reader', 'sec_reader', 'sem_reader']
+
+    # the lines which are cut off by the prefix are left to check()
+    file = get_file(app, 'sem.txt', '$SEM_DATA_VERSION 1\n' + 'x' * 5000 + '\n')
+    sem_reader = registry.readers['sem_reader']
+    assert sem_reader(file).quick_check(file.content[:registry.prefix_size])
+    assert sem_reader(file).quick_check(file.content[:10])
+
+    file = get_file(app, 'sem.txt', 'SEM_DATA_VERSION 1\n' + 'x' * 5000 + '\n')
+    assert not sem_reader(file).quick_check(file.content[:registry.prefix_size])
+
+    # binary files are rejected by the text readers
+    file = get_file(app, 'rand.bin', bytes(range(256)) * 4)
+    assert not registry.readers['csv_reader'](file).quick_check(file.content[:registry.prefix_size])
+    assert not registry.readers['ascii_reader'](file).quick_check(file.content[:registry.prefix_size])
+
+
+def get_tables(reader):
+    reader.process()
+    return [dict(table, rows=[list(row) for row in table['rows']]) for table in reader.tables]
+
+
+@pytest.mark.parametrize('file_name,content', samples, ids=sample_names)
+def test_shared_file_data(app, file_name, content):
+    # the lines, csv dialect and csv rows, which the readers before the matching reader stored
+    # in the file, give the same tables as a file which is only checked by the matching reader
+    file = get_file(app, file_name, content)
+    reader = registry.match_reader(file)
+    if reader is not None and reader.file.encoding != 'binary':
+        single_reader = type(reader)(get_file(app, file_name, content))
+        assert single_reader.check()
+        assert get_tables(reader) == get_tables(single_reader)
+
+
+def test_shared_lines_and_rows(app, monkeypatch):
+    sniffed = []
+    sniff_dialect = CSVReader.sniff_dialect
+    monkeypatch.setattr(CSVReader, 'sniff_dialect', lambda self: sniffed.append(self) or sniff_dialect(self))
+
+    # the dialect of a file is sniffed only once for all csv based readers, even if none was found
+    file = get_file(app, 'test.csv', 'x;y\r\n1;2\r\n"a;b";4\r\n')
+    assert registry.match_reader(file).identifier == 'csv_reader'
+    assert len(sniffed) == 1
+    assert file.lines == file.string.splitlines()
+    assert file.csv_rows == list(csv.reader(io.StringIO(file.string), file.csv_dialect))
+    assert file.csv_rows[2] == ['a;b', '4']
+
+    sniffed.clear()
+    file = get_file(app, 'test.csv', 'no delimiters\nin this file\n')
+    assert registry.match_reader(file).identifier == 'ascii_reader'
+    assert len(sniffed) == 1
+    assert file.csv_dialect is None
@@ -0,0 +1,182 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from .app import create_app
+from .converters import Converter
+from .models import File, conversion_cache
+from .readers import registry
+from .writers.jcamp import JcampWriter
+
+PROFILE_ID = '11111111-1111-4111-8111-111111111111'
+
+
+def get_profile(title='test'):
+    return {
+        'identifiers': [
+            {'type': 'fileMetadata', 'key': 'extension', 'value': '.csv', 'match': 'exact', 'optional': False}
+        ],
+        'tables': [{
+            'header': {'DATA CLASS': 'XYPOINTS', 'TITLE': title},
+            'table': {
+                'xColumn': {'tableIndex': 0, 'columnIndex': 0},
+                'yColumn': {'tableIndex': 0, 'columnIndex': 1},
+            }
+        }]
+    }
+
+
+def get_upload(factor, file_name='test.csv'):
+    content = 'x,y\n' + ''.join('{},{}\n'.format(i, factor * i) for i in range(30))
+    return io.BytesIO(content.encode()), file_name
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILES_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setenv('CONVERSIONS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TABLES_STORE_DIR', str(tmp_path / 'tables'))
+    monkeypatch.delenv('HTPASSWD_PATH', raising=False)
+    monkeypatch.delenv('MATCH_WORKERS', raising=False)
+    monkeypatch.delenv('RENDER_WORKERS', raising=False)
+
+    write_profile(tmp_path, get_profile())
+    return create_app()
+
+
+def write_profile(tmp_path, profile):
+    profiles_path = tmp_path / 'profiles' / 'dev'
+    profiles_path.mkdir(parents=True, exist_ok=True)
+    (profiles_path / '{}.json'.format(PROFILE_ID)).write_text(json.dumps(profile))
+
+
+def get_cache_files(tmp_path):
+    return sorted((tmp_path / 'cache').glob('[!.]*'))
+
+
+def post_conversion(client, **data):
+    data.setdefault('format', 'jcamp')
+    response = client.post('/conversions', data=data)
+    return response.status_code, response.get_data()
+
+
+def test_conversions_cache(app, client, tmp_path):
+    status_code, data = post_conversion(client, file=get_upload(2))
+    assert status_code == 200
+    assert b'##TITLE=test' in data
+
+    cache_files = get_cache_files(tmp_path)
+    assert len(cache_files) == 1
+    assert cache_files[0].read_bytes() == data
+
+    # the output is now taken from the cache
+    cache_files[0].write_bytes(b'cached')
+    assert post_conversion(client, file=get_upload(2)) == (200, b'cached')
+
+    # a different file, format, or setting is converted again
+    assert post_conversion(client, file=get_upload(3))[1] not in [b'cached', data]
+    assert post_conversion(client, file=get_upload(2), format='jcamp:difdup')[1] != b'cached'
+    zip_data = post_conversion(client, file=get_upload(2), format='jcampzip')[1]
+    app.config['ZIP_COMPRESSLEVEL'] = 0
+    assert post_conversion(client, file=get_upload(2), format='jcampzip')[1] != zip_data
+    assert len(get_cache_files(tmp_path)) == 5
+
+    # so is the same file, once the profiles were changed
+    write_profile(tmp_path, get_profile('changed'))
+    status_code, data = post_conversion(client, file=get_upload(2))
+    assert b'##TITLE=changed' in data
+    assert len(get_cache_files(tmp_path)) == 6
+
+
+def test_conversions_cache_errors(app, client, tmp_path):
+    assert post_conversion(client, file=get_upload(2), format='xyz')[0] == 400
+    assert post_conversion(client, file=(io.BytesIO(b'\x00\x01\x02'), 'test.bin'))[0] == 400
+    assert get_cache_files(tmp_path) == []
+
+
+def test_conversions_cache_evict(app, client, tmp_path):
+    post_conversion(client, file=get_upload(2))
+    cache_file = get_cache_files(tmp_path)[0]
+    os.utime(cache_file, (0, 0))
+
+    # the least recently used output is removed, once the cache is too large
+    app.config['CONVERSIONS_CACHE_SIZE'] = cache_file.stat().st_size + 1
+    post_conversion(client, file=get_upload(3))
+    cache_files = get_cache_files(tmp_path)
+    assert len(cache_files) == 1
+    assert cache_files != [cache_file]
+
+
+def test_conversions_handle(app, client, tmp_path):
+    # the tables are only kept, if a handle is requested
+    response = client.post('/tables', data={'file': get_upload(2)})
+    assert response.status_code == 201
+    assert 'handle' not in response.get_json()
+    assert not (tmp_path / 'tables').exists()
+
+    response = client.post('/tables', data={'file': get_upload(2), 'handle': 'true'})
+    assert response.status_code == 201
+    assert len(response.get_json()['tables'][0]['rows']) == 10
+    handle = response.get_json()['handle']
+
+    # the tables are stored as JSON
+    with open(tmp_path / 'tables' / 'dev' / handle) as fp:
+        assert len(json.load(fp)['data']['tables'][0]['rows']) == 30
+
+    status_code, data = post_conversion(client, handle=handle)
+    assert status_code == 200
+    assert post_conversion(client, file=get_upload(2)) == (status_code, data)
+
+    # a different file with the same name gets a different output
+    response = client.post('/tables', data={'file': get_upload(7), 'handle': 'true'})
+    status_code, other_data = post_conversion(client, handle=response.get_json()['handle'])
+    assert status_code == 200
+    assert other_data != data
+    assert b'29, 203' in other_data
+
+    assert post_conversion(client, handle='11111111-1111-4111-8111-111111111111')[0] == 404
+    assert post_conversion(client, handle='../profiles')[0] == 404
+
+
+@pytest.mark.parametrize('header,conversion_format', [
+    ({'DATA CLASS': 'XYPOINTS'}, 'jcamp'),
+    ({'DATA CLASS': 'XYDATA', 'FIRSTX': '0', 'DELTAX': '1'}, 'jcamp'),
+    ({'DATA CLASS': 'XYDATA', 'FIRSTX': '0', 'DELTAX': '1'}, 'jcamp:difdup')
+])
+def test_conversions_stream(app, client, tmp_path, header, conversion_format):
+    profile = get_profile()
+    profile['tables'][0]['header'].update(header)
+    write_profile(tmp_path, profile)
+    app.config['CONVERSIONS_CACHE_DIR'] = None
+    content = 'x,y\n' + ''.join('{},{}\n'.format(i, i * i % 997 / 4) for i in range(20000))
+
+    # the streamed output is sent in several chunks, and is the same as the output of write()
+    status_code, data = post_conversion(client, file=(io.BytesIO(content.encode()), 'test.csv'), format=conversion_format)
+    assert status_code == 200
+
+    response = client.post('/conversions', data={'file': (io.BytesIO(content.encode()), 'test.csv'),
+                                                  'format': conversion_format})
+    assert response.status_code == 200
+    assert response.is_streamed
+    chunks = list(response.response)
+    assert len(chunks) > 1
+
+    with app.app_context():
+        reader = registry.match_reader(File(FileStorage(io.BytesIO(content.encode()), 'test.csv')))
+        reader.process()
+        converter = Converter.match_profile('dev', reader.as_dict)
+        converter.process()
+        writer = JcampWriter(converter, conversion_format.partition(':')[2].upper() or None)
+        writer.process()
+        assert b''.join(chunks) == data == writer.write().encode()
+
+
+def test_upload_hash():
+    upload = FileStorage(io.BytesIO(b'test'), 'test.csv')
+    upload.stream.read()
+    assert conversion_cache.get_upload_hash(upload) == hashlib.sha256(b'test').hexdigest()
+    assert upload.stream.read() == b'test'
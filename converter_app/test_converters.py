@@ -0,0 +1,732 @@
+import copy
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+import pytest
+
+from .app import create_app
+from .converters import (Converter, HeaderIndex, IdentifierMatcher, MatchPool, ProfileMemo, ProfilePrefilter,
+                         match_pool)
+from .models import NumberColumn, Profile, ProfileList, Table
+
+
+def fix_float(value):
+    return str(value).replace(',', '.').replace('e', 'E')
+
+
+def apply_operation(value, op_value, op_operator):
+    # the previous implementation of Converter.apply_operation, which works on strings
+    try:
+        float_value = float(fix_float(value))
+
+        if op_operator == '+':
+            return float_value + float(op_value)
+        elif op_operator == '-':
+            return float_value - float(op_value)
+        elif op_operator == '*':
+            return float_value * float(op_value)
+        elif op_operator == ':':
+            return float_value / float(op_value)
+    except ValueError:
+        return None
+
+
+def run_operation(rows, operation):
+    # the previous implementation of Converter.run_operation, which is called for each operation
+    for i, row in enumerate(rows):
+        op_value = None
+        if operation.get('type') == 'column':
+            try:
+                op_value = operation['rows'][i]
+            except IndexError:
+                pass
+        elif operation.get('type') == 'value':
+            op_value = operation.get('value')
+
+        if op_value:
+            rows[i] = str(apply_operation(row, op_value, operation.get('operator')))
+
+    return rows
+
+
+def test_run_operations_random():
+    rng = random.Random(17)
+    converter = Converter.__new__(Converter)
+    values = ['1.5', '2', '-3.25', 'abc', '', '0', '1e3', 'None', 'nan', 'inf', '1e-5', '2,5']
+    operation_values = ['2', '0.5', '-1', 'x', '', None, 0, '1e2', 3]
+
+    for _ in range(3000):
+        rows = [fix_float(rng.choice(values)) for _ in range(rng.randint(0, 12))]
+        operations = []
+        operations_rows = []
+        for _ in range(rng.randint(0, 3)):
+            operation = {
+                'type': rng.choice(['value', 'column', 'other']),
+                'operator': rng.choice(['+', '-', '*', ':', '^', None])
+            }
+            if operation['type'] == 'value':
+                operation['value'] = rng.choice(operation_values)
+                operations_rows.append([])
+            elif operation['type'] == 'column':
+                operations_rows.append([fix_float(rng.choice(values)) for _ in range(rng.randint(0, len(rows) + 2))])
+            else:
+                operations_rows.append([])
+            operations.append(operation)
+
+        try:
+            expected = list(rows)
+            for operation, operation_rows in zip(operations, operations_rows):
+                expected = run_operation(expected, dict(operation, rows=operation_rows))
+        except ZeroDivisionError:
+            expected = ZeroDivisionError
+
+        try:
+            result = converter.run_operations(NumberColumn(rows), operations,
+                                              [NumberColumn(operation_rows) for operation_rows in operations_rows])
+        except ZeroDivisionError:
+            assert expected is ZeroDivisionError
+        else:
+            assert list(result) == expected, (rows, operations, operations_rows)
+
+            # the floats which are passed on to the writers are the floats of the strings
+            assert list(map(repr, result.floats)) == list(map(repr, NumberColumn.parse(result)))
+
+
+
+def gather_columns(input_tables, output_table):
+    # the previous implementation of the column gathering in Converter.process, which
+    # walks all cells of all input tables and applies the operations one after another
+    x_column = output_table.get('table', {}).get('xColumn')
+    y_column = output_table.get('table', {}).get('yColumn')
+    x_operations = [dict(operation) for operation in output_table.get('table', {}).get('xOperations', [])]
+    y_operations = [dict(operation) for operation in output_table.get('table', {}).get('yOperations', [])]
+
+    x_rows = []
+    y_rows = []
+    for operation in x_operations + y_operations:
+        if operation.get('type') == 'column':
+            operation['rows'] = []
+
+    for table_index, table in enumerate(input_tables):
+        for row in table['rows']:
+            for column_index, column in enumerate(table['columns']):
+                if x_column and table_index == x_column.get('tableIndex') and \
+                        column_index == x_column.get('columnIndex'):
+                    x_rows.append(fix_float(row[column_index]))
+
+                if y_column and table_index == y_column.get('tableIndex') and \
+                        column_index == y_column.get('columnIndex'):
+                    y_rows.append(fix_float(row[column_index]))
+
+                for operation in x_operations + y_operations:
+                    if operation.get('type') == 'column' and \
+                            table_index == operation.get('column', {}).get('tableIndex') and \
+                            column_index == operation.get('column', {}).get('columnIndex'):
+                        operation['rows'].append(fix_float(row[column_index]))
+
+    for operation in x_operations:
+        x_rows = run_operation(x_rows, operation)
+    for operation in y_operations:
+        y_rows = run_operation(y_rows, operation)
+
+    return x_rows, y_rows
+
+
+def get_random_tables(rng):
+    values = ['1.5', '2', '-3,25', 'abc', '', '0', '1e3', '1.234,5', 'nan', '7']
+    tables = []
+    for _ in range(rng.randint(0, 3)):
+        table = Table()
+        columns = rng.randint(0, 3)
+        table['columns'] = [{'key': str(index), 'name': 'Column #{}'.format(index)} for index in range(columns)]
+        table['rows'] = [[rng.choice(values) for _ in range(columns)] for _ in range(rng.randint(0, 8))]
+        if rng.random() < 0.5:
+            table.pack()
+        tables.append(table)
+
+    return tables
+
+
+def get_random_column(rng):
+    return {'tableIndex': rng.choice([0, 1, 2, 5, '0', None]), 'columnIndex': rng.choice([0, 1, 2, '1', None])}
+
+
+def get_random_operations(rng):
+    operations = []
+    for _ in range(rng.randint(0, 2)):
+        if rng.random() < 0.5:
+            operations.append({'type': 'column', 'operator': rng.choice(['+', '*']), 'column': get_random_column(rng)})
+        else:
+            operations.append({'type': 'value', 'operator': rng.choice(['-', ':']), 'value': rng.choice(['2', '', '0.5'])})
+    return operations
+
+
+def test_process_columns_random():
+    rng = random.Random(9)
+
+    for _ in range(2000):
+        file_data = {'metadata': {}, 'tables': get_random_tables(rng)}
+        output_table = {'header': {}, 'table': {'xOperations': get_random_operations(rng),
+                                                'yOperations': get_random_operations(rng)}}
+        for key in ['xColumn', 'yColumn']:
+            if rng.random() < 0.9:
+                output_table['table'][key] = get_random_column(rng)
+
+        profile_string = json.dumps(output_table)
+        converter = Converter(Profile({'identifiers': [], 'tables': [output_table]}, 'dev'), file_data)
+        converter.process()
+        x_rows, y_rows = gather_columns(file_data['tables'], output_table)
+
+        # the rows of the operation columns are not stored in the profile anymore
+        assert json.dumps(output_table) == profile_string
+
+        assert list(converter.tables[0]['x']) == x_rows, (file_data, output_table)
+        assert list(converter.tables[0]['y']) == y_rows, (file_data, output_table)
+
+        # the floats and decimals, which are passed to the writers, are those of the strings
+        for key in ['x', 'y']:
+            column = converter.tables[0][key]
+            assert list(map(repr, column.floats)) == list(map(repr, NumberColumn.parse(column)))
+            if column.decimal is not None:
+                assert all(len(string.partition('.')[2]) == column.decimal for string in column)
+
+
+def test_match_pool():
+    pool = MatchPool()
+    pool.start(2)
+    executor = pool.executor
+    assert executor is not None
+
+    # the pool is only started once
+    pool.start(2)
+    assert pool.executor is executor
+
+    # the pending tasks are cancelled at shutdown
+    futures = [pool.submit(executor, time.sleep, 0.1) for _ in range(10)]
+    pool.shutdown()
+    assert pool.executor is None
+    assert any(future.cancelled() for future in futures)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILES_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.delenv('MATCH_WORKERS', raising=False)
+    monkeypatch.delenv('RENDER_WORKERS', raising=False)
+    return create_app()
+
+
+def write_profiles(tmp_path, profiles_data):
+    profiles_path = tmp_path / 'profiles' / 'dev'
+    profiles_path.mkdir(parents=True, exist_ok=True)
+    for profile_data in profiles_data:
+        (profiles_path / '{}.json'.format(uuid.uuid4())).write_text(json.dumps(profile_data))
+
+
+def get_rival_profile(rng):
+    # a profile for csv files, which needs one of a few header lines,
+    # and has a random number of optional identifiers
+    identifiers = [
+        {'type': 'fileMetadata', 'key': 'extension', 'value': '.csv', 'match': 'exact', 'optional': False},
+        {'type': 'tableHeader', 'tableIndex': 0, 'value': 'device: (\\w+) {}'.format(rng.randint(0, 4)),
+         'match': 'regex', 'optional': False}
+    ]
+    for _ in range(rng.randint(0, 3)):
+        identifiers.append({'type': 'tableMetadata', 'tableIndex': 0, 'key': 'rows', 'value': '2',
+                            'match': 'exact', 'optional': True})
+
+    return {'identifiers': identifiers, 'tables': []}
+
+
+def get_file_data(line):
+    return {
+        'metadata': {'extension': '.csv', 'reader': 'CSVReader'},
+        'tables': [{
+            'header': ['title', line],
+            'metadata': {'rows': '2', 'columns': '2'},
+            'columns': [{'key': '0', 'name': 'Column #0'}, {'key': '1', 'name': 'Column #1'}],
+            'rows': [['1', '2'], ['3', '4']]
+        }]
+    }
+
+
+def test_match_pool_serial(app, tmp_path):
+    rng = random.Random(15)
+    write_profiles(tmp_path, [get_rival_profile(rng) for _ in range(Converter.parallel_min_profiles + 20)])
+
+    match_pool.start(2)
+    try:
+        with app.app_context():
+            profiles = Profile.list('dev')
+            profiles_path = tmp_path / 'profiles' / 'dev'
+
+            for index in range(6):
+                file_data = get_file_data('device: abc {}'.format(index))
+                candidates = Converter.get_candidates(profiles, file_data)
+                serial_converter = Converter.match_candidates(candidates, file_data)
+
+                # the pool finds the same winner as the serial matching, or no winner
+                result = match_pool.match(profiles_path, 'dev', 32, file_data, len(candidates), 2)
+                if serial_converter is None:
+                    assert index == 5
+                    assert result == (None, None)
+                else:
+                    position, profile_id = result
+                    assert profile_id == serial_converter.profile.id
+                    assert candidates[position] is serial_converter.profile
+
+                    app.config['MATCH_WORKERS'] = 2
+                    converter = Converter.match_all('dev', candidates, file_data)
+                    app.config['MATCH_WORKERS'] = 1
+                    assert converter.profile is serial_converter.profile
+                    assert converter.results == serial_converter.results
+    finally:
+        match_pool.shutdown()
+
+
+def test_profile_memo(app, tmp_path):
+    rng = random.Random(16)
+    write_profiles(tmp_path, [get_rival_profile(rng) for _ in range(30)])
+
+    with app.app_context():
+        for index in [2, 2, 3, 2, 3, 5, 2]:
+            file_data = get_file_data('device: abc {}'.format(index))
+            profiles = Profile.list('dev')
+            full_scan_converter = Converter.match_candidates(Converter.get_candidates(profiles, file_data), file_data)
+
+            # the remembered profile is only a hint, the winner is the same as with the full scan, even
+            # if the remembered profile was the winner of a different file with the same fingerprint
+            converter = Converter.match_profile('dev', file_data)
+            if full_scan_converter is None:
+                assert converter is None
+            else:
+                assert converter.profile.id == full_scan_converter.profile.id
+                assert converter.results == full_scan_converter.results
+
+                fingerprint = profiles.memo.get_fingerprint(file_data)
+                assert profiles.memo.get(fingerprint) == converter.profile.id
+
+
+def test_profile_memo_fingerprint():
+    memo = ProfileMemo()
+    fingerprint = memo.get_fingerprint(get_file_data('device: abc 1'))
+
+    # files with other values have the same fingerprint
+    assert memo.get_fingerprint(get_file_data('device: xyz 2')) == fingerprint
+
+    # files with the same shape, but other header lines, metadata, or columns, don't
+    assert memo.get_fingerprint(get_file_data('sample: abc 1')) != fingerprint
+
+    file_data = get_file_data('device: abc 1')
+    file_data['tables'][0]['metadata']['column_00'] = 'x'
+    assert memo.get_fingerprint(file_data) != fingerprint
+
+    file_data = get_file_data('device: abc 1')
+    file_data['tables'][0]['columns'][0]['name'] = 'Column #0 (time)'
+    assert memo.get_fingerprint(file_data) != fingerprint
+
+
+
+def get_random_identifier(rng):
+    identifier = {
+        'type': rng.choice(['fileMetadata', 'fileMetadata', 'tableMetadata', 'tableHeader', 'other']),
+        'optional': rng.random() < 0.3
+    }
+
+    if identifier['type'] == 'tableHeader':
+        identifier['value'] = rng.choice(['Title', 'Title: (.*)', 'Date: (\\d+)', '(\\d+)', 'x', '', 'Date: 2021'])
+        if rng.random() < 0.5:
+            identifier['lineNumber'] = rng.choice([1, 2, '2', 5, 'x', None])
+    else:
+        identifier['key'] = rng.choice(['extension', 'reader', 'rows', 'columns', 'missing', ''])
+        identifier['value'] = rng.choice(['.csv', '.txt', 'CSVReader', '2', 2, '3', '.*', '^\\.c', None])
+
+    if identifier['type'] != 'fileMetadata':
+        identifier['tableIndex'] = rng.choice([0, 1, '0', 3, None])
+
+    if rng.random() < 0.8:
+        identifier['match'] = rng.choice(['exact', 'exact', 'regex', 'any'])
+    else:
+        identifier['isRegex'] = rng.random() < 0.5
+
+    if (identifier.get('match') == 'regex' or identifier.get('isRegex')) and not isinstance(identifier['value'], str):
+        # a regex which is not a string fails for every file
+        identifier['value'] = '.*'
+
+    if rng.random() < 0.3:
+        identifier['outputKey'] = 'KEY'
+        identifier['outputTableIndex'] = rng.choice([0, 1, None])
+
+    if rng.random() < 0.2:
+        identifier['operations'] = [{'operator': rng.choice(['+', '*']), 'value': rng.choice(['2', '', 'x'])}]
+
+    return identifier
+
+
+def get_random_profiles(rng, count):
+    profiles = []
+    for index in range(count):
+        profile_data = {
+            'identifiers': [get_random_identifier(rng) for _ in range(rng.randint(0, 4))],
+            'tables': [{'header': {}, 'table': {'xColumn': {'tableIndex': 0, 'columnIndex': 0},
+                                                'yColumn': {'tableIndex': 0, 'columnIndex': 0}}}]
+        }
+        if rng.random() < 0.3:
+            profile_data['matchTables'] = True
+        profiles.append(Profile(profile_data, 'dev', str(index)))
+
+    return profiles
+
+
+def get_random_file_data(rng):
+    header_lines = ['Title: test', 'Date: 2021', '', '  ', 'x = 1', 'Title', '12 3']
+    file_data = {
+        'metadata': {
+            'extension': rng.choice(['.csv', '.txt', '']),
+            'reader': rng.choice(['CSVReader', 'AsciiReader'])
+        },
+        'tables': []
+    }
+    if rng.random() < 0.3:
+        file_data['metadata']['rows'] = rng.choice(['2', 2])
+
+    for _ in range(rng.randint(0, 2)):
+        file_data['tables'].append({
+            'header': [rng.choice(header_lines) for _ in range(rng.randint(0, 4))],
+            'metadata': {'rows': rng.choice(['2', '3']), 'columns': '1'},
+            'columns': [{'key': '0', 'name': 'Column #0'}],
+            'rows': [['1'], ['2']]
+        })
+
+    return file_data
+
+
+def get_winner(converter):
+    return None if converter is None else (converter.profile.id, converter.results)
+
+
+def test_profile_prefilter_random():
+    rng = random.Random(11)
+
+    for _ in range(300):
+        profiles = get_random_profiles(rng, rng.randint(0, 30))
+        prefilter = ProfilePrefilter(profiles)
+
+        for _ in range(10):
+            file_data = get_random_file_data(rng)
+            candidates = prefilter.filter(file_data['metadata'])
+
+            # the candidates keep their order, and the profiles which were dropped can't match
+            assert candidates == [profile for profile in profiles if profile in candidates]
+            for profile in profiles:
+                if profile not in candidates:
+                    assert Converter(profile, file_data).match() is False
+
+            assert get_winner(Converter.match_candidates(candidates, file_data)) == \
+                get_winner(Converter.match_candidates(profiles, file_data))
+
+
+
+class IdentifierConverter(object):
+    # the previous implementation of the matching in Converter, which uses the identifiers of the profile
+
+    def __init__(self, profile, file_data):
+        self.profile = profile
+        self.matches = []
+        self.file_metadata = file_data.get('metadata', {})
+        self.input_tables = file_data.get('tables', [])
+
+        if self.profile.data.get('matchTables'):
+            self.identifiers = []
+            for identifier in self.profile.data.get('identifiers', []):
+                if identifier.get('outputTableIndex') is None:
+                    self.identifiers.append(identifier)
+                else:
+                    for input_table_index, input_table in enumerate(self.input_tables):
+                        identifier_copy = copy.deepcopy(identifier)
+                        identifier_copy['outputTableIndex'] = input_table_index
+                        if identifier_copy.get('tableIndex') is not None:
+                            identifier_copy['tableIndex'] = input_table_index
+                        self.identifiers.append(identifier_copy)
+        else:
+            self.identifiers = self.profile.data.get('identifiers', [])
+
+    def match(self):
+        for identifier in self.identifiers:
+            match = self.match_identifier(identifier)
+            if match is False and not identifier.get('optional'):
+                return False
+
+            if match and 'value' in match:
+                for match_operation in identifier.get('operations', []):
+                    match['value'] = self.run_identifier_operation(match['value'], match_operation)
+
+            self.matches.append({
+                'identifier': identifier,
+                'result': match
+            })
+
+        return len(self.matches)
+
+    def match_identifier(self, identifier):
+        if identifier.get('type') == 'fileMetadata':
+            return self.match_file_metadata(identifier, self.file_metadata)
+        elif identifier.get('type') == 'tableMetadata':
+            return self.match_table_metadata(identifier, self.input_tables)
+        elif identifier.get('type') == 'tableHeader':
+            return self.match_table_header(identifier, self.input_tables)
+        else:
+            return False
+
+    def match_file_metadata(self, identifier, metadata):
+        input_key = identifier.get('key')
+        input_value = metadata.get(input_key)
+        if input_key and input_value:
+            value = self.match_value(identifier, input_value)
+            if value:
+                return {
+                    'value': value
+                }
+
+        return False
+
+    def match_table_metadata(self, identifier, input_tables):
+        input_table_index = identifier.get('tableIndex')
+        input_table = self.get_input_table(input_table_index, input_tables)
+        if input_table is not None:
+            input_key = identifier.get('key', None)
+            input_value = input_table.get('metadata', {}).get(input_key, None)
+            if input_key is not None and input_value is not None:
+                value = self.match_value(identifier, input_value)
+                if value:
+                    return {
+                        'value': value,
+                        'tableIndex': input_table_index
+                    }
+
+        return False
+
+    def match_table_header(self, identifier, input_tables):
+        input_table_index = identifier.get('tableIndex')
+        input_table = self.get_input_table(input_table_index, input_tables)
+        if input_table is not None:
+            try:
+                line_number = int(identifier.get('lineNumber'))
+            except (ValueError, TypeError):
+                line_number = None
+
+            if line_number is None:
+                header = os.linesep.join(input_table['header']).rstrip()
+            else:
+                try:
+                    header = input_table['header'][line_number - 1].rstrip()
+                except IndexError:
+                    return False
+
+            if header:
+                value = self.match_value(identifier, header)
+                if value:
+                    if line_number is None:
+                        line_number = self.get_line_number(input_table['header'], value)
+
+                    return {
+                        'value': value,
+                        'tableIndex': input_table_index,
+                        'lineNumber': line_number,
+                    }
+
+        return False
+
+    def match_value(self, identifier, value):
+        if value is not None:
+            value = str(value)
+            if identifier.get('isRegex') or identifier.get('match') == 'regex':
+                match = re.search(identifier.get('value'), str(value))
+                if match:
+                    try:
+                        return match.group(1).strip()
+                    except IndexError:
+                        return match.group(0).strip()
+                else:
+                    return False
+            elif identifier.get('match') == 'any':
+                return value if value else False
+            else:
+                result = (value == str(identifier.get('value')))
+                return value if result else False
+        else:
+            return False
+
+    def run_identifier_operation(self, value, operation):
+        op_value = operation.get('value')
+        if op_value:
+            return apply_operation(value, op_value, operation.get('operator'))
+        else:
+            return value
+
+    def get_input_table(self, index, input_tables):
+        if index is not None:
+            try:
+                if int(index) >= len(input_tables):
+                    return None
+                else:
+                    return input_tables[int(index)]
+            except KeyError:
+                return None
+
+    def get_line_number(self, header, value):
+        for i, line in enumerate(header):
+            if value in line:
+                return i + 1
+
+
+def get_result(function, *args):
+    # the result of the function, or the type of the exception it raised
+    try:
+        return function(*args)
+    except Exception as e:
+        return type(e)
+
+
+def test_identifier_matcher_random():
+    rng = random.Random(12)
+
+    for _ in range(5000):
+        identifier = get_random_identifier(rng)
+        if rng.random() < 0.1:
+            identifier['tableIndex'] = rng.choice(['x', 1.5, -1])
+
+        file_data = get_random_file_data(rng)
+        profile = Profile({'identifiers': [identifier], 'tables': []}, 'dev')
+
+        converter = Converter(profile, file_data)
+        identifier_converter = IdentifierConverter(profile, file_data)
+        assert get_result(converter.match_identifier, IdentifierMatcher(identifier)) == \
+            get_result(identifier_converter.match_identifier, identifier), (identifier, file_data)
+
+
+def test_identifier_matcher_tables_random():
+    # the matchers of matchTables profiles are copied for every input table, like the identifiers
+    rng = random.Random(12)
+
+    for _ in range(1000):
+        profile = get_random_profiles(rng, 1)[0]
+        profile.data['matchTables'] = True
+        file_data = get_random_file_data(rng)
+
+        converter = Converter(profile, file_data)
+        identifier_converter = IdentifierConverter(profile, file_data)
+        assert len(converter.matchers) == len(identifier_converter.identifiers)
+        for matcher, identifier in zip(converter.matchers, identifier_converter.identifiers):
+            assert get_result(converter.match_identifier, matcher) == \
+                get_result(identifier_converter.match_identifier, identifier), (identifier, file_data)
+
+            # the copies share the compiled regex and operations with the matcher of the profile
+            assert any(matcher.base is base for base in converter.compiled_profile.matchers)
+
+
+def test_header_matcher_random():
+    # the identifiers in the header of the output tables (e.g. FIRSTX) are compiled as well
+    rng = random.Random(12)
+
+    for _ in range(1000):
+        header_identifier = get_random_identifier(rng)
+        file_data = get_random_file_data(rng)
+        output_table = {'header': {'TITLE': 'test', 'FIRSTX': header_identifier}, 'table': {}}
+        profile = Profile({'identifiers': [], 'tables': [output_table]}, 'dev')
+
+        converter = Converter(profile, file_data)
+        result = get_result(converter.process)
+        if result is None:
+            match = IdentifierConverter(profile, file_data).match_identifier(header_identifier)
+            expected = {'TITLE': 'test', 'FIRSTX': match['value']} if match else {'TITLE': 'test'}
+            assert converter.tables[0]['header'] == expected
+        else:
+            assert get_result(IdentifierConverter(profile, file_data).match_identifier, header_identifier) == result
+
+
+
+def test_header_index_random():
+    rng = random.Random(13)
+    words = ['a', 'b', 'ab', '1', ' ', '', '\t', 'a b', os.linesep]
+    identifier_converter = IdentifierConverter(Profile({}, 'dev'), {})
+
+    for _ in range(5000):
+        header = [''.join(rng.choice(words) for _ in range(rng.randint(0, 4))) for _ in range(rng.randint(0, 6))]
+        header_index = HeaderIndex(header)
+        assert header_index.text == os.linesep.join(header).rstrip()
+
+        for _ in range(5):
+            # parts of the joined header, which can extend over the end of a line, and other strings
+            if header_index.joined and rng.random() < 0.7:
+                start = rng.randrange(len(header_index.joined))
+                value = header_index.joined[start:start + rng.randint(1, 6)]
+            else:
+                value = ''.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+
+            if value:
+                assert header_index.get_line_number(value) == \
+                    identifier_converter.get_line_number(header, value), (header, value)
+
+
+def test_header_index_shared_random():
+    # the header indexes which are shared by all profiles give the same results as an index for each profile
+    rng = random.Random(13)
+
+    for _ in range(300):
+        profiles = get_random_profiles(rng, rng.randint(1, 20))
+        file_data = get_random_file_data(rng)
+
+        header_indexes = {}
+        for profile in profiles:
+            shared_converter = Converter(profile, file_data, header_indexes)
+            converter = Converter(profile, file_data)
+            assert get_result(shared_converter.match) == get_result(converter.match)
+            assert shared_converter.results == converter.results
+
+
+
+def match_candidates(profiles, file_data):
+    # the previous Converter.match_profile, without the prefilter and the memo
+    converter = None
+    matches = 0
+    for profile in profiles:
+        current_converter = IdentifierConverter(profile, file_data)
+        current_matches = current_converter.match()
+        if current_matches is not False and current_matches > matches:
+            converter = current_converter
+            matches = current_matches
+
+    return converter
+
+
+def test_match_random():
+    # the identifiers are checked in the order of their cost, but the result is the same
+    rng = random.Random(14)
+
+    for _ in range(300):
+        profiles = get_random_profiles(rng, rng.randint(1, 20))
+        file_data = get_random_file_data(rng)
+
+        for profile in profiles:
+            converter = Converter(profile, file_data)
+            identifier_converter = IdentifierConverter(profile, file_data)
+            matches = converter.match()
+            assert matches == identifier_converter.match()
+
+            # the matches of profiles which did not match are not used
+            if matches is not False:
+                assert converter.matches == identifier_converter.matches
+
+        candidates = Converter.get_candidates(ProfileList(profiles), file_data)
+        converter = Converter.match_candidates(candidates, file_data)
+        identifier_converter = match_candidates(profiles, file_data)
+        if identifier_converter is None:
+            assert converter is None
+        else:
+            assert converter.profile is identifier_converter.profile
+            assert converter.matches == identifier_converter.matches
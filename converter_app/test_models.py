@@ -0,0 +1,245 @@
+import io
+import json
+import mmap
+import os
+import random
+
+import openpyxl
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from .app import create_app
+from .models import (File, FloatColumn, ProfileCache, Table, TableRows, evict_files, get_file_type,
+                     open_atomic)
+
+
+def get_random_rows(rng):
+    strings = ['1.5', '1.50', '-0', '0', '-0.0', 'nan', 'inf', '-inf', 'NaN', '1e5', '1E5', '1_0', ' 2',
+               '3.14159265358979323846', '1.0000000000000002', '0.1', '123456789012345678', 'x', '', '007',
+               '+1', '.5', '5.']
+
+    columns = rng.randint(0, 4)
+    return [
+        [rng.choice(strings) if rng.random() < 0.7 else '%.*f' % (rng.randint(0, 5), rng.uniform(-1e4, 1e4))
+         for _ in range(columns)]
+        for _ in range(rng.randint(1, 30))
+    ]
+
+
+def test_table_rows_random():
+    rng = random.Random(8)
+
+    for _ in range(2000):
+        rows = get_random_rows(rng)
+        table_rows = TableRows.pack(rows)
+
+        assert len(table_rows) == len(rows)
+        assert list(table_rows) == rows
+        assert [table_rows[index] for index in range(-len(rows), len(rows))] == rows + rows
+        assert table_rows[:3] == rows[:3]
+        assert table_rows[1::2] == rows[1::2]
+
+        for index in range(len(rows[0])):
+            column = table_rows.column(index)
+            assert list(column) == [row[index] for row in rows]
+            assert [column[i] for i in range(len(rows))] == [row[index] for row in rows]
+
+
+def test_float_column():
+    column = FloatColumn.pack(['1.50', '2.25', '-0.00'])
+    assert column.decimal == 2
+    assert list(column) == ['1.50', '2.25', '-0.00']
+
+    column = FloatColumn.pack(['1', '1e5', '0.1', 'nan', '1_0'])
+    assert column.decimal is None
+    assert list(column) == ['1', '1e5', '0.1', 'nan', '1_0']
+
+    assert FloatColumn.pack(['1', 'x']) is None
+
+
+def test_table_pack():
+    table = Table()
+    table['rows'] = [['1', 'a'], ['2', 'b']]
+    table.pack()
+    assert isinstance(table['rows'], TableRows)
+    assert list(table['rows']) == [['1', 'a'], ['2', 'b']]
+    assert list(table['rows'].column(1)) == ['a', 'b']
+
+    # tables with different numbers of cells in their rows are kept as they are
+    table = Table()
+    table['rows'] = [['1', '2'], ['3']]
+    table.pack()
+    assert table['rows'] == [['1', '2'], ['3']]
+
+
+def write_profile(file_path, title, mtime_ns):
+    file_path.write_text(json.dumps({'title': title}))
+    os.utime(file_path, ns=(mtime_ns, mtime_ns))
+
+
+def get_titles(profile_cache, profiles_path):
+    return sorted(profile.data['title'] for profile in profile_cache.get(profiles_path, 'dev', 32))
+
+
+def test_profile_cache(tmp_path):
+    profile_cache = ProfileCache()
+    mtime_ns = 10**18
+
+    write_profile(tmp_path / 'a.json', 'a', mtime_ns)
+    os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+    profiles = profile_cache.get(tmp_path, 'dev', 32)
+    assert get_titles(profile_cache, tmp_path) == ['a']
+
+    # the list is kept as long as nothing changes
+    assert profile_cache.get(tmp_path, 'dev', 32) is profiles
+
+    # a file which was replaced with the same size and mtime is noticed by its inode
+    write_profile(tmp_path / 'b.tmp', 'b', mtime_ns)
+    os.replace(tmp_path / 'b.tmp', tmp_path / 'a.json')
+    os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+    assert get_titles(profile_cache, tmp_path) == ['b']
+
+
+def test_profile_cache_racy(tmp_path):
+    # two changes in the same tick of the mtime are both noticed, since recent mtimes are not trusted
+    profile_cache = ProfileCache()
+    mtime_ns = (tmp_path / '.').stat().st_mtime_ns
+
+    write_profile(tmp_path / 'a.json', 'a', mtime_ns)
+    os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+    assert get_titles(profile_cache, tmp_path) == ['a']
+
+    write_profile(tmp_path / 'a.json', 'c', mtime_ns)
+    write_profile(tmp_path / 'b.json', 'b', mtime_ns)
+    os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+    assert get_titles(profile_cache, tmp_path) == ['b', 'c']
+
+    # unchanged profiles are kept, even if they are checked again
+    profiles = profile_cache.get(tmp_path, 'dev', 32)
+    assert profile_cache.get(tmp_path, 'dev', 32) is profiles
+
+
+def test_open_atomic(tmp_path):
+    path = tmp_path / 'file'
+    with open_atomic(path) as fp:
+        fp.write(b'a')
+        assert not path.exists()
+    assert path.read_bytes() == b'a'
+
+    # a file which was not written completely is not replaced, and the temporary file is removed
+    with pytest.raises(ValueError):
+        with open_atomic(path) as fp:
+            fp.write(b'b')
+            raise ValueError
+    assert list(tmp_path.iterdir()) == [path]
+    assert path.read_bytes() == b'a'
+
+
+def test_evict_files(tmp_path):
+    for index, name in enumerate(['a', 'b', 'c', '.d.tmp']):
+        (tmp_path / name).write_bytes(b'x' * 10)
+        os.utime(tmp_path / name, (index, index))
+    (tmp_path / 'e').write_bytes(b'x' * 10)
+
+    # the least recently used files are removed first, temporary files are kept
+    evict_files(tmp_path.iterdir(), 30)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['.d.tmp', 'b', 'c', 'e']
+
+    # with a ttl, the expired files are removed, including temporary files
+    evict_files(tmp_path.iterdir(), 30, ttl=3600)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['e']
+
+
+@pytest.fixture
+def app():
+    return create_app()
+
+
+def get_xlsx():
+    rng = random.Random(4)
+    workbook = openpyxl.Workbook()
+    for index in range(2000):
+        workbook.active.append([index, rng.random(), 'row {}'.format(index)])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def get_file(content, file_name):
+    return File(FileStorage(io.BytesIO(content), file_name))
+
+
+@pytest.mark.parametrize('magic_buffer_size', [512, 64 * 1024])
+def test_file_type_xlsx(app, magic_buffer_size):
+    app.config['MAGIC_BUFFER_SIZE'] = magic_buffer_size
+    content = get_xlsx()
+
+    # a short prefix of an .xlsx file is only a zip file, the type of the whole file is used
+    assert get_file_type(content[:512])[0] == 'application/zip'
+    with app.app_context():
+        file = get_file(content, 'test.xlsx')
+
+    assert (file.mime_type, file.encoding) == get_file_type(content)
+    assert file.mime_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def test_file_type_text(app):
+    app.config['MAGIC_BUFFER_SIZE'] = 512
+    content = ''.join('{},{}\n'.format(i, i * 0.5) for i in range(1000)).encode()
+
+    with app.app_context():
+        file = get_file(content, 'test.csv')
+
+    assert (file.mime_type, file.encoding) == get_file_type(content)
+    assert file.string == content.decode()
+
+
+def get_csv(rows):
+    rng = random.Random(5)
+    return 'x,y\n' + ''.join('{},{:.5f}\n'.format(index, rng.random()) for index in range(rows))
+
+
+@pytest.mark.parametrize('in_file', [False, True])
+def test_file_spool(app, tmp_path, in_file):
+    content = get_csv(2000).encode()
+    if in_file:
+        # an upload, which werkzeug already spooled to a file
+        path = tmp_path / 'upload'
+        path.write_bytes(content)
+        stream = open(path, 'rb')
+    else:
+        stream = io.BytesIO(content)
+
+    with app.app_context():
+        app.config['SPOOL_SIZE'] = 1000
+        app.config['MAGIC_BUFFER_SIZE'] = 512
+        file = File(FileStorage(stream, 'test.csv'))
+
+        app.config['SPOOL_SIZE'] = len(content)
+        read_file = get_file(content, 'test.csv')
+
+    with stream:
+        # files larger than SPOOL_SIZE are mapped into memory, and behave like files which were read
+        assert isinstance(file.content, mmap.mmap)
+        assert isinstance(read_file.content, bytes)
+        assert file.content[:] == content
+        assert (file.mime_type, file.encoding) == (read_file.mime_type, read_file.encoding)
+        assert file.string == read_file.string
+        assert file.lines == read_file.lines
+        assert file.fp.read() == content
+
+
+def test_file_spool_encoding(app):
+    # the type of a mapped file is detected on the whole file, if the rest does not fit the prefix
+    content = get_csv(2000).encode() + 'caf\xe9\n'.encode('latin-1')
+
+    with app.app_context():
+        app.config['SPOOL_SIZE'] = 1000
+        app.config['MAGIC_BUFFER_SIZE'] = 512
+        file = get_file(content, 'test.csv')
+
+    assert isinstance(file.content, mmap.mmap)
+    assert get_file_type(content[:512])[1] == 'us-ascii'
+    assert (file.mime_type, file.encoding) == get_file_type(content)
+    assert file.string == content.decode(file.encoding)
@@ -1,6 +1,6 @@
 import pytest
 
-from . import create_app
+from .app import create_app
 
 
 @pytest.fixture
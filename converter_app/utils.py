@@ -1,7 +1,11 @@
+import atexit
 import base64
 import hashlib
 import re
+import threading
 import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 
 
 def human2bytes(string):
@@ -44,3 +48,58 @@ def checkpw(password, hashed_password):
     m = hashlib.sha1()
     m.update(password)
     return (b'{SHA}' + base64.b64encode(m.digest())) == hashed_password
+
+
+class ProcessPool(object):
+    # a pool of processes, which is started by create_app, i.e. once in every (gunicorn) worker before
+    # it handles requests, so that the processes are not forked from a thread which handles a request,
+    # the pool is shut down at exit, and a broken pool is not started again (see reset)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.workers = None
+
+        # the futures which were submitted, so that the pending ones can be cancelled at shutdown
+        self.futures = weakref.WeakSet()
+
+    def start(self, workers):
+        with self.lock:
+            if self.executor is not None and self.workers != workers:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+                self.workers = workers
+
+                # the processes are forked when the first task is submitted
+                self.executor.submit(int).result()
+
+        atexit.unregister(self.shutdown)
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                for future in list(self.futures):
+                    future.cancel()
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def reset(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def get_executor(self):
+        # the executor of the pool, or None if the pool is not started
+        with self.lock:
+            return self.executor
+
+    def submit(self, executor, fn, *args):
+        future = executor.submit(fn, *args)
+        with self.lock:
+            self.futures.add(future)
+        return future
@@ -8,3 +8,20 @@ class Writer(object):
 
     def process(self):
         raise NotImplementedError
+
+    def stream(self):
+        # the output in chunks for a streamed response, by default all at once
+        yield self.write()
+
+    def get_floats(self, strings):
+        # the converter passes the floats together with the strings, otherwise
+        # the strings are parsed, None marks strings which are not numbers
+        floats = getattr(strings, 'floats', None)
+        if floats is None:
+            floats = []
+            for string in strings:
+                try:
+                    floats.append(float(string))
+                except ValueError:
+                    floats.append(None)
+        return floats
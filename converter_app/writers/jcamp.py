@@ -1,9 +1,13 @@
+import functools
 import io
+import itertools
+import operator
 import os
 import sys
+from decimal import Decimal
 
 from .. import __title__, __version__
-from ..options import DATA_TYPES, DATA_CLASSES, XUNITS, YUNITS
+from ..options import DATA_TYPES, DATA_CLASSES, XUNITS, YUNITS, XYDATA_ENCODINGS
 from .base import Writer
 
 
@@ -13,19 +17,46 @@ class JcampWriter(Writer):
     suffix = '.jdx'
     mimetype = 'chemical/x-jcamp-dx'
 
-    def __init__(self, converter):
+    # the size of the chunks of stream()
+    chunk_size = 64 * 1024
+
+    # the maximal length of the lines of compressed xydata
+    line_length = 80
+
+    # the pseudo digits of the compressed xydata, for the digits 0 to 9 (or -0 to -9)
+    sqz_digits = dict(zip('0123456789', '@ABCDEFGHI'), **dict(zip(['-' + d for d in '0123456789'], '@abcdefghi')))
+    dif_digits = dict(zip('0123456789', '%JKLMNOPQR'), **dict(zip(['-' + d for d in '0123456789'], '%jklmnopqr')))
+    dup_digits = dict(zip('123456789', 'STUVWXYZs'))
+
+    # the compressed xydata falls back to AFFN, if the y values scaled to integers are not exact as
+    # floats (for the readers of the file), or if they need more decimals than a float has for YFACTOR
+    max_integer = 2**53
+    max_decimals = 300
+
+    def __init__(self, converter, encoding=None):
         self.table = converter.tables[0]
+        self.encoding = encoding
         self.buffer = io.StringIO()
 
+        # the output before self.buffer, strings and functions which create the lines of the data
+        self.parts = []
+
     def process(self):
         self.process_table(self.table)
 
     def process_table(self, table):
         header = table.get('header', {})
 
+        # the encoding of the xydata is needed for the version, since the compressed forms are from JCAMP-DX 5.01
+        data_class = header.get('DATA CLASS', DATA_CLASSES[0])
+        if data_class == 'XYDATA':
+            encoding, integers, max_decimal = self.get_encoding(header, table.get('y'))
+        else:
+            encoding, integers, max_decimal = XYDATA_ENCODINGS[0], None, None
+
         jcamp_header = {
             'TITLE': header.get('TITLE', 'Spectrum'),
-            'JCAMP-DX': '5.00 $$ {} ({})'.format(__title__, __version__),
+            'JCAMP-DX': '{} $$ {} ({})'.format('5.00' if encoding == 'AFFN' else '5.01', __title__, __version__),
             'DATA TYPE': header.get('DATA TYPE', DATA_TYPES[0]),
             'DATA CLASS': header.get('DATA CLASS', DATA_CLASSES[0]),
             'ORIGIN': header.get('ORIGIN', ''),
@@ -33,19 +64,18 @@ class JcampWriter(Writer):
         }
         for key in header:
             key_upper = key.upper()
-            if key_upper not in jcamp_header:
+            if key_upper not in jcamp_header and key_upper != 'XYDATA ENCODING':
                 jcamp_header[key_upper] = header[key]
         self.write_header(jcamp_header)
 
-        data_class = header.get('DATA CLASS', DATA_CLASSES[0])
         if data_class == 'XYDATA':
-            self.process_xydata(header, table.get('y'))
+            self.process_xydata(header, table.get('y'), encoding, integers, max_decimal)
         elif data_class in ['XYPOINTS', 'PEAK TABLE']:
             self.process_xypoints(header, table.get('x'), table.get('y'))
         elif data_class == 'NTUPLES':
             self.process_ntuples(header, table.get('x'), table.get('y'))
 
-    def process_xydata(self, header, y):
+    def process_xydata(self, header, y, encoding, integers=None, max_decimal=None):
         firstx = header.get('FIRSTX')
         lastx = header.get('LASTX')
         deltax = header.get('DELTAX')
@@ -61,23 +91,19 @@ class JcampWriter(Writer):
             deltax = (float(lastx) - float(firstx)) / (npoints - 1)
 
         # find YFACTOR, MINY, and MAXY
-        miny = sys.float_info.max
-        maxy = sys.float_info.min
-        max_decimal = 0
+        y_floats = self.get_floats(y)
+        if None in y_floats:
+            # raise the error of float() for the first string which is not a number
+            float(y[y_floats.index(None)])
 
-        for i, string in enumerate(y):
-            value = float(string)
-            try:
-                index = string.index('.')
-            except ValueError:
-                index = 0
+        miny, maxy = self.get_range(y_floats)
 
-            decimal = len(string) - index - 1
-
-            miny = min(miny, value)
-            maxy = max(maxy, value)
-            max_decimal = max(max_decimal, decimal)
-        yfactor = 10**(-decimal)
+        if encoding == 'AFFN':
+            decimals = self.get_decimals(y)
+            max_decimal = max(0, max(decimals))
+            yfactor = 10**(-decimals[-1])
+        else:
+            yfactor = 10**(-max_decimal)
 
         # write header with xydata specific values
         self.write_header({
@@ -95,7 +121,10 @@ class JcampWriter(Writer):
         })
 
         # write the xydata
-        self.write_xydata(y, npoints, firstx, deltax, max_decimal)
+        if encoding == 'AFFN':
+            self.write_xydata(y, npoints, firstx, deltax, max_decimal, decimals)
+        else:
+            self.write_xydata_compressed(integers, npoints, firstx, deltax, encoding)
 
         # write the end
         self.buffer.write('##END=$$ End of the data block' + os.linesep)
@@ -109,25 +138,15 @@ class JcampWriter(Writer):
         lastx = x[-1]
         npoints = len(x)
 
-        # find MINX, MAXX, MINY, MAXY
-        minx = sys.float_info.max
-        maxx = sys.float_info.min
-        miny = sys.float_info.max
-        maxy = sys.float_info.min
-        for x_string, y_string in zip(x, y):
-            try:
-                x_float = float(x_string)
-                minx = min(minx, x_float)
-                maxx = max(maxx, x_float)
-            except ValueError:
-                continue
-
-            try:
-                y_float = float(y_string)
-                miny = min(miny, y_float)
-                maxy = max(maxy, y_float)
-            except ValueError:
-                continue
+        # find MINX, MAXX, MINY, MAXY, pairs are skipped from the first string which is not a number
+        x_floats = self.get_floats(x)[:len(y)]
+        y_floats = self.get_floats(y)[:len(x)]
+        if None in x_floats or None in y_floats:
+            y_floats = [y_float for x_float, y_float in zip(x_floats, y_floats) if x_float is not None and y_float is not None]
+            x_floats = [x_float for x_float in x_floats if x_float is not None]
+
+        minx, maxx = self.get_range(x_floats)
+        miny, maxy = self.get_range(y_floats)
 
         # write header with xydata specific values
         self.write_header({
@@ -160,17 +179,15 @@ class JcampWriter(Writer):
         npoints = len(x)
 
         # find MINX, MAXX, MINY, MAXY
-        minx = sys.float_info.max
-        maxx = sys.float_info.min
-        miny = sys.float_info.max
-        maxy = sys.float_info.min
-        for x_string, y_string in zip(x, y):
-            x_float, y_float = float(x_string), float(y_string)
+        x_floats = self.get_floats(x)[:len(y)]
+        y_floats = self.get_floats(y)[:len(x)]
+        if None in x_floats or None in y_floats:
+            # raise the error of float() for the first string which is not a number
+            for x_string, y_string in zip(x, y):
+                float(x_string), float(y_string)
 
-            minx = min(minx, x_float)
-            maxx = max(maxx, x_float)
-            miny = min(miny, y_float)
-            maxy = max(maxy, y_float)
+        minx, maxx = self.get_range(x_floats)
+        miny, maxy = self.get_range(y_floats)
 
         # write header with ntuples specific values
         data_class = header.get('DATA CLASS', DATA_CLASSES[0])
@@ -209,32 +226,176 @@ class JcampWriter(Writer):
         self.buffer.write('##END NTUPLES={}'.format(data_class) + os.linesep)
         self.buffer.write('##END=$$ End of the data block' + os.linesep)
 
+    def get_encoding(self, header, y):
+        # the encoding of the writer (from the conversion format) wins over the one of the profile, for the
+        # compressed encodings, the y values as integers and their number of decimals are returned as well
+        encoding = (self.encoding or header.get('XYDATA ENCODING') or XYDATA_ENCODINGS[0]).upper()
+        assert encoding in XYDATA_ENCODINGS
+
+        # the y values are checked in process_xydata
+        if encoding == 'AFFN' or not y or None in self.get_floats(y):
+            return encoding, None, None
+
+        integers, max_decimal = self.get_integers(y)
+        if integers is None or max_decimal > self.max_decimals or \
+                max(map(abs, integers)) > self.max_integer:
+            return XYDATA_ENCODINGS[0], None, None
+
+        return encoding, integers, max_decimal
+
+    def get_range(self, floats):
+        # the same as comparing the floats one by one with min() and max(), starting with
+        # sys.float_info.max and sys.float_info.min, which are also the result without floats
+        return (min(itertools.chain((sys.float_info.max, ), floats)),
+                max(itertools.chain((sys.float_info.min, ), floats)))
+
+    def get_decimals(self, strings):
+        # the number of characters after the period, or the number of characters minus one
+        # for strings without a period, the converter passes them if they are all the same
+        decimal = getattr(strings, 'decimal', None)
+        if decimal is not None:
+            return [decimal] * len(strings)
+        else:
+            return [len(string) - max(string.find('.'), 0) - 1 for string in strings]
+
+    def get_integers(self, strings):
+        # the strings as integers, together with the number of decimals they are scaled with,
+        # or None, if a string is not a finite number
+        decimal = getattr(strings, 'decimal', None)
+        if decimal is not None:
+            return list(map(int, '\x00'.join(strings).replace('.', '').split('\x00'))), decimal
+
+        numbers = list(map(Decimal, strings))
+        if not all(number.is_finite() for number in numbers):
+            return None, None
+
+        decimal = max(0, -min(number.as_tuple().exponent for number in numbers))
+        return [int(number.scaleb(decimal)) for number in numbers], decimal
+
+    def get_sqz(self, integers):
+        # the integers in SQZ form, the first digit (and sign) is replaced by a pseudo digit
+        return [self.sqz_digits[string[:2]] + string[2:] if string[0] == '-' else
+                self.sqz_digits[string[0]] + string[1:] for string in map(str, integers)]
+
+    def get_dif(self, integers):
+        # the differences between the integers in DIF form
+        return [self.dif_digits[string[:2]] + string[2:] if string[0] == '-' else
+                self.dif_digits[string[0]] + string[1:]
+                for string in map(str, map(operator.sub, integers[1:], integers[:-1]))]
+
+    def get_dup(self, count):
+        # the DUP form of a repeat count
+        string = str(count)
+        return self.dup_digits[string[0]] + string[1:]
+
     def write_header(self, header):
         for key, value in header.items():
             if value is not None:
                 self.buffer.write('##{}={}'.format(key, value) + os.linesep)
 
-    def write_xydata(self, y, npoints, firstx, deltax, max_decimal):
+    def write_xydata(self, y, npoints, firstx, deltax, max_decimal, decimals):
+        # check the x values now, since the lines are written later
+        float(firstx), float(deltax)
+        self.write_lines(self.iter_xydata, y, npoints, firstx, deltax, max_decimal, decimals)
+
+    def write_xydata_compressed(self, integers, npoints, firstx, deltax, encoding):
+        float(firstx), float(deltax)
+        self.write_lines(self.iter_xydata_compressed, integers, npoints, firstx, deltax, encoding)
+
+    def write_xypoints(self, x, y):
+        self.write_lines(self.iter_xypoints, x, y)
+
+    def write_lines(self, function, *args):
+        # the lines are only created by the generator function(*args), when the output is written
+        self.parts.append(self.buffer.getvalue())
+        self.parts.append(functools.partial(function, *args))
+        self.buffer = io.StringIO()
+
+    def iter_xydata(self, y, npoints, firstx, deltax, max_decimal, decimals):
         for i in range(0, npoints, self.nline):
             x = float(firstx) + i * float(deltax)
 
             line = str(x)
-            for j in range(self.nline):
-                if i + j < npoints:
-                    string = y[i+j]
-                    try:
-                        index = string.index('.')
-                    except ValueError:
-                        index = 0
-                    decimal = len(string) - index - 1
-                    line += ',' + string.replace('.', '') + (max_decimal - decimal) * '0'
-
-            self.buffer.write(line + os.linesep)
-
-    def write_xypoints(self, x, y):
+            for j in range(i, min(i + self.nline, npoints)):
+                line += ',' + y[j].replace('.', '') + (max_decimal - decimals[j]) * '0'
+
+            yield line + os.linesep
+
+    def iter_xydata_compressed(self, integers, npoints, firstx, deltax, encoding):
+        # in SQZ form, every y value is written with a pseudo digit for its sign and first digit, in DIF
+        # form, only the first y value of a line, followed by the differences to the previous y values,
+        # the last point of a line is then repeated on the next line and after the last line (y check),
+        # with DUP, repeated values (or differences) are written once, followed by the repeat count
+        dif = encoding.startswith('DIF')
+        sqz = self.get_sqz(integers)
+        tokens = self.get_dif(integers) if dif else sqz
+
+        if encoding.endswith('DUP'):
+            groups = [(token, sum(1 for _ in group)) for token, group in itertools.groupby(tokens)]
+        else:
+            groups = [(token, 1) for token in tokens]
+
+        # the x values are followed by a space, since E is also the exponent of a float
+        start, group_index = 0, 0
+        while True:
+            line = str(float(firstx) + start * float(deltax)) + ' '
+            if dif:
+                line += sqz[start]
+
+            stop = start
+            while group_index < len(groups):
+                token, count = groups[group_index]
+                if count > 1:
+                    token += self.get_dup(count)
+
+                # every line gets at least one token
+                if len(line) + len(token) > self.line_length and stop > start:
+                    break
+
+                line += token
+                stop += count
+                group_index += 1
+
+            yield line + os.linesep
+
+            if group_index == len(groups):
+                break
+            start = stop
+
+        if dif:
+            yield str(float(firstx) + (npoints - 1) * float(deltax)) + ' ' + sqz[-1] + os.linesep
+
+    def iter_xypoints(self, x, y):
         for x_string, y_string in zip(x, y):
             line = x_string + ', ' + y_string
-            self.buffer.write(line + os.linesep)
+            yield line + os.linesep
+
+    def iter_output(self):
+        yield from self.iter_parts(self.parts)
+        yield self.buffer.getvalue()
+
+    def iter_parts(self, parts):
+        for part in parts:
+            if callable(part):
+                yield from part()
+            else:
+                yield part
+
+    def iter_chunks(self, strings):
+        # the strings encoded in chunks of about chunk_size characters
+        chunk, size = [], 0
+        for string in strings:
+            chunk.append(string)
+            size += len(string)
+            if size >= self.chunk_size:
+                yield ''.join(chunk).encode()
+                chunk, size = [], 0
+
+        if chunk:
+            yield ''.join(chunk).encode()
 
     def write(self):
-        return self.buffer.getvalue()
+        return ''.join(self.iter_output())
+
+    def stream(self):
+        return self.iter_chunks(self.iter_output())
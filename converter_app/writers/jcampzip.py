@@ -1,9 +1,16 @@
 import io
 import hashlib
+import itertools
 import json
 import zipfile
 import logging
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
 
+from flask import current_app
+
+from ..utils import ProcessPool
 from .jcamp import JcampWriter
 
 logger = logging.getLogger(__name__)
@@ -14,14 +21,24 @@ class JcampZipWriter(JcampWriter):
     suffix = '.zip'
     mimetype = 'application/zip'
 
-    def __init__(self, converter):
+    # the minimal number of tables for the parallel rendering (see RENDER_WORKERS)
+    parallel_min_tables = 4
+
+    def __init__(self, converter, encoding=None):
         self.profile = converter.profile
         self.matches = converter.matches
         self.tables = converter.tables
-        self.zipbuffer = io.BytesIO()
+        self.encoding = encoding
+
+        # a level of 0 stores the files without compression
+        self.compresslevel = int(current_app.config['ZIP_COMPRESSLEVEL'])
+        self.workers = int(current_app.config['RENDER_WORKERS'])
+
+        # the file names and the parts (see JcampWriter.write_lines) of the tables
+        self.files = []
 
     def process(self):
-        metadata = {
+        self.metadata = {
             'profileId': self.profile.id,
             'ols': self.profile.data.get('ols'),
             'matches': self.matches,
@@ -29,29 +46,62 @@ class JcampZipWriter(JcampWriter):
             'tables': []
         }
 
-        sha256_string = ''
-        sha512_string = ''
-
-        zf = zipfile.ZipFile(self.zipbuffer, 'w')
+        # the headers are created and checked for all tables now, the zip is created in stream()
         for table_id, table in enumerate(self.tables):
             self.buffer = io.StringIO()
+            self.parts = []
             self.process_table(table)
-            string = self.buffer.getvalue()
+            self.parts.append(self.buffer.getvalue())
 
             file_name = 'data/table_{:02d}.jdx'.format(table_id + 1)
-            zf.writestr(file_name, string)
-
-            sha256_string += '{} {}\n'.format(hashlib.sha256(string.encode()).hexdigest(), file_name)
-            sha512_string += '{} {}\n'.format(hashlib.sha512(string.encode()).hexdigest(), file_name)
+            self.files.append((file_name, self.parts))
 
-            metadata['tablesCount'] += 1
-            metadata['tables'].append({
+            self.metadata['tablesCount'] += 1
+            self.metadata['tables'].append({
                 'fileName': file_name,
                 'header': table['header']
             })
 
+    def stream(self):
+        # the zip file is written to a buffer, which is emptied after each chunk, every table is
+        # encoded once for the zip file and the hashes of the bagit manifests at the same time,
+        # files without compression are emptied only after each file, since ZipFile writes their
+        # sizes and CRC into the header afterwards (many readers reject stored files with a data
+        # descriptor, which follows the data of a file, when the zip file is written sequentially)
+        stored = self.compresslevel == 0
+        stream = ZipStream(seekable=stored)
+        if stored:
+            zf = zipfile.ZipFile(stream, 'w')
+        else:
+            zf = zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED, compresslevel=self.compresslevel)
+
+        sha256_string = ''
+        sha512_string = ''
+
+        for (file_name, parts), rendered in zip(self.files, self.render_tables()):
+            with zf.open(file_name, 'w') as fp:
+                if rendered is None:
+                    sha256 = hashlib.sha256()
+                    sha512 = hashlib.sha512()
+                    for chunk in self.iter_chunks(self.iter_parts(parts)):
+                        sha256.update(chunk)
+                        sha512.update(chunk)
+                        fp.write(chunk)
+                        if not stored:
+                            yield from stream.read()
+
+                    sha256_hexdigest, sha512_hexdigest = sha256.hexdigest(), sha512.hexdigest()
+                else:
+                    data, sha256_hexdigest, sha512_hexdigest = rendered
+                    fp.write(data)
+
+            yield from stream.read()
+
+            sha256_string += '{} {}\n'.format(sha256_hexdigest, file_name)
+            sha512_string += '{} {}\n'.format(sha512_hexdigest, file_name)
+
         metadata_file_name = 'metadata/converter.json'
-        metadata_string = json.dumps(metadata, indent=2)
+        metadata_string = json.dumps(self.metadata, indent=2)
         sha256_string += '{} {}\n'.format(hashlib.sha256(metadata_string.encode()).hexdigest(), metadata_file_name)
         sha512_string += '{} {}\n'.format(hashlib.sha512(metadata_string.encode()).hexdigest(), metadata_file_name)
         zf.writestr(metadata_file_name, metadata_string)
@@ -63,6 +113,110 @@ class JcampZipWriter(JcampWriter):
 
         # close zip file
         zf.close()
+        yield from stream.read()
 
     def write(self):
-        return self.zipbuffer.getvalue()
+        return b''.join(self.stream())
+
+    def render_tables(self):
+        # the tables rendered by the render pool in their order, None for tables, which are rendered
+        # in this process, the tables were already checked in process(), so rendering them succeeds
+        if self.workers > 1 and len(self.tables) >= self.parallel_min_tables:
+            yield from render_pool.render(self.tables, self.encoding, self.workers)
+        else:
+            yield from itertools.repeat(None, len(self.tables))
+
+
+class ZipStream(object):
+    # a file-like object, which collects the written bytes until they are read, if it is not seekable,
+    # tell() and seek() fail, so that ZipFile writes the zip file sequentially, otherwise ZipFile can
+    # seek back to the bytes which were not read yet
+
+    def __init__(self, seekable=False):
+        self._seekable = seekable
+        self.buffer = bytearray()
+
+        # the number of bytes which were read, and the position in the buffer
+        self.offset = 0
+        self.position = 0
+
+    def seekable(self):
+        return self._seekable
+
+    def tell(self):
+        if not self._seekable:
+            raise io.UnsupportedOperation('tell')
+        return self.offset + self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if not self._seekable or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('seek')
+        if not self.offset <= offset <= self.offset + len(self.buffer):
+            raise io.UnsupportedOperation('seek to bytes which were already read')
+
+        self.position = offset - self.offset
+        return offset
+
+    def write(self, data):
+        size = len(data)
+        self.buffer[self.position:self.position + size] = data
+        self.position += size
+        return size
+
+    def flush(self):
+        pass
+
+    def read(self):
+        # the written bytes as a list with one or no item
+        chunks = [bytes(self.buffer)] if self.buffer else []
+        self.offset += len(self.buffer)
+        self.buffer = bytearray()
+        self.position = 0
+        return chunks
+
+
+class RenderPool(ProcessPool):
+    # a pool of processes, which render the tables of a JcampZipWriter, at most two tables per
+    # process are rendered ahead of the table which is written, a broken pool is not started
+    # again, the tables are rendered in the request from now on
+
+    def render(self, tables, encoding, workers):
+        # yields the result of render_table for every table in order, or None
+        # for the remaining tables, if the pool could not be used
+        executor = self.get_executor()
+        if executor is None:
+            yield from itertools.repeat(None, len(tables))
+            return
+
+        pending = iter(tables)
+        futures = deque()
+        count = 0
+        try:
+            for table in itertools.islice(pending, 2 * workers):
+                futures.append(self.submit(executor, render_table, table, encoding))
+
+            while futures:
+                result = futures.popleft().result()
+                for table in itertools.islice(pending, 1):
+                    futures.append(self.submit(executor, render_table, table, encoding))
+
+                count += 1
+                yield result
+        except BrokenProcessPool:
+            logger.exception('the render pool is broken')
+            self.reset(executor)
+            yield from itertools.repeat(None, len(tables) - count)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def render_table(table, encoding):
+    # runs in the processes of the RenderPool, the hashes for the bagit manifests are computed here as well
+    writer = JcampWriter(SimpleNamespace(tables=[table]), encoding)
+    writer.process()
+    data = writer.write().encode()
+    return data, hashlib.sha256(data).hexdigest(), hashlib.sha512(data).hexdigest()
+
+
+render_pool = RenderPool()
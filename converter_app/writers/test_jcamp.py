@@ -0,0 +1,166 @@
+import random
+import re
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from ..models import NumberColumn
+from .jcamp import JcampWriter
+
+sqz_digits = {character: index for index, character in enumerate('@ABCDEFGHI')}
+sqz_digits.update({character: -index for index, character in enumerate('@abcdefghi') if index})
+dif_digits = {character: index for index, character in enumerate('%JKLMNOPQR')}
+dif_digits.update({character: -index for index, character in enumerate('%jklmnopqr') if index})
+dup_digits = {character: index + 1 for index, character in enumerate('STUVWXYZs')}
+
+token_pattern = re.compile(r'([@A-Ia-i%J-Rj-rS-Zs])(\d*)')
+
+
+def get_number(digits, character, string):
+    digit = digits[character]
+    number = int(str(abs(digit)) + string)
+    return -number if digit < 0 or character in 'abcdefghijklmnopqr' else number
+
+
+def decode_xydata(lines):
+    # decodes (X++(Y..Y)) lines in the SQZ, DIF, and DUP forms of JCAMP-DX 5.01, and returns the
+    # x value of each line with the index of its first y value, and the y values as integers
+    x_values, y_values = [], []
+    dif = dif_line = False
+    for line in lines:
+        x_string, _, line = line.partition(' ')
+        tokens = token_pattern.findall(line)
+        assert ''.join(character + string for character, string in tokens) == line
+
+        values = []
+        previous = None
+        for character, string in tokens:
+            if character in sqz_digits:
+                previous = get_number(sqz_digits, character, string)
+                values.append(previous)
+                dif = False
+            elif character in dif_digits:
+                previous = get_number(dif_digits, character, string)
+                values.append(values[-1] + previous)
+                dif = True
+            else:
+                for _ in range(get_number(dup_digits, character, string) - 1):
+                    values.append(values[-1] + previous if dif else previous)
+
+        if y_values and dif_line:
+            # the first y value of a line after a DIF line is the y check
+            assert values[0] == y_values[-1]
+            values = values[1:]
+            index = len(y_values) - 1
+        else:
+            index = len(y_values)
+
+        x_values.append((float(x_string), index))
+        y_values += values
+        dif_line = dif
+
+    return x_values, y_values
+
+
+def write_xydata(y, encoding):
+    converter = SimpleNamespace(tables=[{
+        'header': {'DATA CLASS': 'XYDATA', 'FIRSTX': '10', 'DELTAX': '0.5'},
+        'y': y
+    }])
+    writer = JcampWriter(converter, encoding)
+    writer.process()
+
+    header, _, data = writer.write().partition('##XYDATA=(X++(Y..Y))\n')
+    header = dict(line[2:].split('=', 1) for line in header.splitlines())
+    lines = data.partition('##END')[0].splitlines()
+    return header, lines
+
+
+@pytest.mark.parametrize('encoding', ['SQZ', 'SQZDUP', 'DIF', 'DIFDUP'])
+def test_xydata_compressed_random(encoding):
+    rng = random.Random(20)
+
+    for _ in range(300):
+        decimal = rng.randint(0, 4)
+        integers = [rng.choice([rng.randint(-10**6, 10**6), rng.randint(-3, 3), 0]) for _ in range(rng.randint(1, 300))]
+        if rng.random() < 0.3:
+            integers = [integers[0]] * len(integers)
+        y = ['%.*f' % (decimal, integer / 10**decimal) for integer in integers]
+        if rng.random() < 0.5:
+            y = NumberColumn(y)
+
+        header, lines = write_xydata(y, encoding)
+        assert header['JCAMP-DX'].startswith('5.01 ')
+        assert all(len(line) <= JcampWriter.line_length for line in lines)
+
+        x_values, y_values = decode_xydata(lines)
+        yfactor = Decimal(header['YFACTOR'])
+        assert [Decimal(value) * yfactor for value in y_values] == [Decimal(string) for string in y]
+
+        for x, index in x_values:
+            assert x == 10 + index * 0.5
+
+
+def test_xydata_affn():
+    header, lines = write_xydata(['1.5', '2.25', '3'], None)
+    assert header['JCAMP-DX'].startswith('5.00 ')
+    assert lines == ['10.0,150,225,300']
+
+
+@pytest.mark.parametrize('y', [
+    ['1', '1e300'],
+    ['1.5', '1e-400'],
+    ['1', 'nan'],
+    ['1', 'inf'],
+    ['12345678901234567890']
+])
+def test_xydata_compressed_fallback(y):
+    # values which can't be written as integers are written in the AFFN form
+    assert write_xydata(y, 'DIFDUP') == write_xydata(y, None)
+
+
+def get_random_strings(rng, count, decimal):
+    # numbers with a fixed number of decimals, or in any format, including strings which are not numbers
+    if decimal is not None:
+        return ['%.*f' % (decimal, rng.uniform(-1000, 1000)) for _ in range(count)]
+    return [rng.choice([
+        '%.*f' % (rng.randint(0, 6), rng.uniform(-1000, 1000)),
+        '%.*e' % (rng.randint(0, 6), rng.uniform(-1e6, 1e6)),
+        str(rng.randint(-100, 100)),
+        'nan', 'inf', 'abc', ''
+    ] if rng.random() < 0.2 else ['%.*f' % (rng.randint(0, 6), rng.uniform(-1000, 1000))]) for _ in range(count)]
+
+
+def write_table(table, encoding):
+    writer = JcampWriter(SimpleNamespace(tables=[table]), encoding)
+    try:
+        writer.process()
+    except ValueError:
+        return None
+    return writer.write()
+
+
+@pytest.mark.parametrize('data_class', ['XYDATA', 'XYPOINTS', 'PEAK TABLE', 'NTUPLES'])
+def test_number_columns_random(data_class):
+    # the floats and decimals, which the converter passes with the strings, give the same
+    # output as the strings, which are parsed by the writer
+    rng = random.Random(21)
+
+    for _ in range(300):
+        count = rng.randint(1, 50)
+        decimal = rng.choice([None, None, rng.randint(1, 5)])
+        x = get_random_strings(rng, count, decimal)
+        y = get_random_strings(rng, count + rng.choice([0, 0, -1, 1]) if count > 1 else count, decimal)
+        header = {'DATA CLASS': data_class, 'FIRSTX': '10', 'DELTAX': '0.5'}
+        encoding = rng.choice(['AFFN', 'SQZ', 'DIFDUP'])
+
+        x_column = NumberColumn(x, NumberColumn.parse(x), decimal)
+        y_column = NumberColumn(y, NumberColumn.parse(y), decimal)
+        # repr() compares nan as well
+        assert list(map(repr, x_column.floats)) == list(map(repr, JcampWriter.get_floats(None, x)))
+        assert list(map(repr, y_column.floats)) == list(map(repr, JcampWriter.get_floats(None, y)))
+
+        output = write_table({'header': header, 'x': x, 'y': y}, encoding)
+        assert write_table({'header': header, 'x': x_column, 'y': y_column}, encoding) == output
+        assert write_table({'header': header, 'x': NumberColumn(x), 'y': NumberColumn(y)}, encoding) == output
@@ -0,0 +1,142 @@
+import hashlib
+import io
+import json
+import struct
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+from ..app import create_app
+from .jcamp import JcampWriter
+from .jcampzip import JcampZipWriter, ZipStream, render_pool
+
+
+@pytest.fixture
+def app():
+    return create_app()
+
+
+def get_converter():
+    tables = []
+    for index in range(3):
+        tables.append({
+            'header': {'DATA CLASS': 'XYDATA', 'FIRSTX': '0', 'DELTAX': '0.5', 'TITLE': 'Table {}'.format(index)},
+            'y': ['{:.2f}'.format((i * (index + 1)) % 17) for i in range(5000)]
+        })
+
+    tables.append({
+        'header': {'DATA CLASS': 'XYPOINTS'},
+        'x': ['1', '2', '3'],
+        'y': ['4.5', '5.5', '6.5']
+    })
+
+    return SimpleNamespace(profile=SimpleNamespace(id='profile', data={'ols': 'CHMO:0000000'}), matches=3, tables=tables)
+
+
+def get_files(converter):
+    # the files of the zip as they were written by the previous JcampZipWriter.process()
+    metadata = {
+        'profileId': converter.profile.id,
+        'ols': converter.profile.data.get('ols'),
+        'matches': converter.matches,
+        'tablesCount': 0,
+        'tables': []
+    }
+
+    files = {}
+    sha256_string = ''
+    sha512_string = ''
+    for table_id, table in enumerate(converter.tables):
+        writer = JcampWriter(SimpleNamespace(tables=[table]))
+        writer.process()
+        string = writer.write()
+
+        file_name = 'data/table_{:02d}.jdx'.format(table_id + 1)
+        files[file_name] = string.encode()
+
+        sha256_string += '{} {}\n'.format(hashlib.sha256(string.encode()).hexdigest(), file_name)
+        sha512_string += '{} {}\n'.format(hashlib.sha512(string.encode()).hexdigest(), file_name)
+
+        metadata['tablesCount'] += 1
+        metadata['tables'].append({
+            'fileName': file_name,
+            'header': table['header']
+        })
+
+    metadata_file_name = 'metadata/converter.json'
+    metadata_string = json.dumps(metadata, indent=2)
+    sha256_string += '{} {}\n'.format(hashlib.sha256(metadata_string.encode()).hexdigest(), metadata_file_name)
+    sha512_string += '{} {}\n'.format(hashlib.sha512(metadata_string.encode()).hexdigest(), metadata_file_name)
+    files[metadata_file_name] = metadata_string.encode()
+
+    files['bagit.txt'] = b'BagIt-Version: 1.0\nTag-File-Character-Encoding: UTF-8\n'
+    files['manifest-sha256.txt'] = sha256_string.encode()
+    files['manifest-sha512.txt'] = sha512_string.encode()
+    return files
+
+
+@pytest.mark.parametrize('compresslevel', [0, 1, 6])
+def test_stream(app, compresslevel):
+    app.config['ZIP_COMPRESSLEVEL'] = compresslevel
+
+    converter = get_converter()
+    with app.app_context():
+        writer = JcampZipWriter(converter)
+        writer.process()
+        data = b''.join(writer.stream())
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert {info.filename: zf.read(info) for info in zf.infolist()} == get_files(converter)
+
+        for info in zf.infolist():
+            if compresslevel == 0:
+                # the sizes and the CRC of stored files are in the local header, without a data descriptor
+                assert info.compress_type == zipfile.ZIP_STORED
+                flags, crc, compress_size, file_size = struct.unpack('<H6xIII', data[info.header_offset + 6:info.header_offset + 26])
+                assert not flags & 0x08
+                assert (crc, compress_size, file_size) == (info.CRC, info.compress_size, info.file_size)
+            else:
+                assert info.compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_stream_render_pool(app):
+    app.config['RENDER_WORKERS'] = 2
+    render_pool.start(2)
+
+    converter = get_converter()
+    try:
+        with app.app_context():
+            writer = JcampZipWriter(converter)
+            writer.process()
+            assert all(rendered is not None for rendered in writer.render_tables())
+            data = b''.join(writer.stream())
+    finally:
+        render_pool.shutdown()
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert {info.filename: zf.read(info) for info in zf.infolist()} == get_files(converter)
+
+
+def test_zip_stream():
+    stream = ZipStream()
+    with pytest.raises(OSError):
+        stream.tell()
+
+    stream = ZipStream(seekable=True)
+    stream.write(b'abcdef')
+    stream.seek(2)
+    stream.write(b'X')
+    stream.seek(6)
+    stream.write(b'g')
+    assert stream.tell() == 7
+    assert stream.read() == [b'abXdefg']
+    assert stream.read() == []
+
+    # bytes which were already read can't be changed anymore
+    with pytest.raises(OSError):
+        stream.seek(0)
+    stream.write(b'h')
+    assert stream.tell() == 8
+    assert stream.read() == [b'h']